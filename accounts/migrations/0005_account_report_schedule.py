@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:45
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_remove_cow_is_pregnant_cow_current_lactation_number_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='report_delivery_time',
+            field=models.TimeField(default=datetime.time(18, 0)),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='report_timezone',
+            field=models.CharField(default='Africa/Nairobi', max_length=64),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 import uuid
+from datetime import time
 
 
 class Account(models.Model):
@@ -30,6 +31,10 @@ class Account(models.Model):
 
     is_active = models.BooleanField(default=True)
 
+    # Daily WhatsApp report schedule, in the account's local time
+    report_delivery_time = models.TimeField(default=time(18, 0))
+    report_timezone = models.CharField(max_length=64, default="Africa/Nairobi")
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
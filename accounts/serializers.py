@@ -1,3 +1,4 @@
+from zoneinfo import available_timezones
 from rest_framework import serializers
 from accounts.models import User, Account,  Farm, User, Cow
 
@@ -13,8 +14,15 @@ class AccountCreateSerializer(serializers.ModelSerializer):
             "company_reg_no",
             "phone",
             "email",
+            "report_delivery_time",
+            "report_timezone",
         ]
 
+    def validate_report_timezone(self, value):
+        if value not in available_timezones():
+            raise serializers.ValidationError("Unknown time zone.")
+        return value
+
 
 class FarmUserCreateSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -151,6 +159,8 @@ class AccountDetailsSerializer(serializers.ModelSerializer):
             "phone",
             "email",
             "is_active",
+            "report_delivery_time",
+            "report_timezone",
             "created_at",
             "farms",
             "users",
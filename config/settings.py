@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 from datetime import timedelta
 from corsheaders.defaults import default_headers
 
@@ -157,3 +157,100 @@ MEDIA_ROOT = BASE_DIR / "media"
 MEDIA_URL = "/media/"
 
 STATIC_URL = 'static/'
+
+# Milk production report cache (MEDIA_ROOT/reports/cache); when disabled,
+# reports are rendered in memory per request
+REPORT_CACHE_ENABLED = config('REPORT_CACHE_ENABLED', default=True, cast=bool)
+REPORT_CACHE_MAX_AGE_DAYS = config(
+    'REPORT_CACHE_MAX_AGE_DAYS', default=7, cast=int)
+REPORT_CACHE_MAX_BYTES = config(
+    'REPORT_CACHE_MAX_BYTES', default=500 * 1024 * 1024, cast=int)
+# Loose report files and render temp files younger than this are kept by
+# sweep_reports, as they may still be written or served
+REPORT_SWEEP_MIN_AGE_MINUTES = config(
+    'REPORT_SWEEP_MIN_AGE_MINUTES', default=60, cast=int)
+# How report downloads are served: "django" (streamed, Range aware),
+# "nginx" (X-Accel-Redirect) or "sendfile" (X-Sendfile). The nginx prefix is
+# an internal location aliased to MEDIA_ROOT/reports.
+REPORT_FILE_BACKEND = config('REPORT_FILE_BACKEND', default='django')
+REPORT_ACCEL_REDIRECT_PREFIX = config(
+    'REPORT_ACCEL_REDIRECT_PREFIX', default='/protected-reports/')
+# Render processes for report PDFs (0 renders inline in the caller) and
+# how long callers wait for a render
+REPORT_RENDER_WORKERS = config('REPORT_RENDER_WORKERS', default=2, cast=int)
+REPORT_RENDER_TIMEOUT = config('REPORT_RENDER_TIMEOUT', default=30, cast=int)
+# Seconds between render pool stats log lines (queue depth, timings) from
+# each process; 0 turns them off
+REPORT_RENDER_STATS_INTERVAL = config(
+    'REPORT_RENDER_STATS_INTERVAL', default=300, cast=int)
+# Report profile sent over WhatsApp ("mobile" or "standard") and the size
+# above which the mobile profile drops its chart
+WHATSAPP_REPORT_PROFILE = config('WHATSAPP_REPORT_PROFILE', default='mobile')
+REPORT_MOBILE_MAX_BYTES = config(
+    'REPORT_MOBILE_MAX_BYTES', default=100 * 1024, cast=int)
+# Seconds a worker waits for another worker rendering the same report
+REPORT_LOCK_TIMEOUT = config('REPORT_LOCK_TIMEOUT', default=120, cast=int)
+
+# Background processing of inbound WhatsApp webhooks
+WEBHOOK_WORKERS = config('WEBHOOK_WORKERS', default=4, cast=int)
+WEBHOOK_STALE_AFTER_MINUTES = config(
+    'WEBHOOK_STALE_AFTER_MINUTES', default=10, cast=int)
+# Tries per inbound message before it is marked failed
+WEBHOOK_MAX_ATTEMPTS = config('WEBHOOK_MAX_ATTEMPTS', default=3, cast=int)
+
+# Outbox delivery of WhatsApp messages: concurrent sends, batch size,
+# attempts before a message is dead-lettered, retry backoff and when a
+# claimed message counts as abandoned by a crashed worker
+OUTBOUND_WORKERS = config('OUTBOUND_WORKERS', default=4, cast=int)
+OUTBOUND_BATCH_SIZE = config('OUTBOUND_BATCH_SIZE', default=50, cast=int)
+OUTBOUND_MAX_ATTEMPTS = config('OUTBOUND_MAX_ATTEMPTS', default=8, cast=int)
+OUTBOUND_RETRY_BASE_SECONDS = config(
+    'OUTBOUND_RETRY_BASE_SECONDS', default=15, cast=float)
+OUTBOUND_RETRY_MAX_SECONDS = config(
+    'OUTBOUND_RETRY_MAX_SECONDS', default=3600, cast=float)
+OUTBOUND_STALE_AFTER_MINUTES = config(
+    'OUTBOUND_STALE_AFTER_MINUTES', default=10, cast=int)
+
+# WhatsApp Graph API client. WHATSAPP_SENDER_IDS is a comma-separated pool
+# of sender phone number ids (PHONE_NUMBER_ID alone when empty); each
+# recipient sticks to one of them.
+WHATSAPP_SENDER_IDS = config('WHATSAPP_SENDER_IDS', default='', cast=Csv())
+WHATSAPP_API_VERSION = config('WHATSAPP_API_VERSION', default='v18.0')
+WHATSAPP_CONNECT_TIMEOUT = config(
+    'WHATSAPP_CONNECT_TIMEOUT', default=3.05, cast=float)
+WHATSAPP_READ_TIMEOUT = config('WHATSAPP_READ_TIMEOUT', default=20, cast=float)
+WHATSAPP_MAX_RETRIES = config('WHATSAPP_MAX_RETRIES', default=3, cast=int)
+WHATSAPP_BACKOFF_BASE = config('WHATSAPP_BACKOFF_BASE', default=0.5, cast=float)
+WHATSAPP_BACKOFF_MAX = config('WHATSAPP_BACKOFF_MAX', default=8, cast=float)
+WHATSAPP_POOL_SIZE = config('WHATSAPP_POOL_SIZE', default=20, cast=int)
+WHATSAPP_CIRCUIT_FAILURES = config(
+    'WHATSAPP_CIRCUIT_FAILURES', default=5, cast=int)
+WHATSAPP_CIRCUIT_RESET_SECONDS = config(
+    'WHATSAPP_CIRCUIT_RESET_SECONDS', default=30, cast=float)
+# Days an uploaded media id stays usable on the Graph API; reports with
+# the same content are sent by id instead of uploaded again until then
+WHATSAPP_MEDIA_TTL_DAYS = config('WHATSAPP_MEDIA_TTL_DAYS', default=30, cast=int)
+# Outbound Graph API calls per second allowed per sender number by our
+# WhatsApp tier. Rate limits are enforced per process, so the tier limit is
+# split evenly over WHATSAPP_SENDING_PROCESSES: every web worker plus the
+# outbox worker and the daily report run that may send at the same time.
+WHATSAPP_MESSAGES_PER_SECOND = config(
+    'WHATSAPP_MESSAGES_PER_SECOND', default=20, cast=float)
+WHATSAPP_SENDING_PROCESSES = config(
+    'WHATSAPP_SENDING_PROCESSES', default=1, cast=int)
+
+# Application logs (render pool stats, retries, dead letters) go to the
+# console alongside the server's own output
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'production': {
+            'handlers': ['console'],
+            'level': config('PRODUCTION_LOG_LEVEL', default='INFO'),
+        },
+    },
+}
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from production.utils.rollups import backfill_milk_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily milk rollup tables from raw milk records"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First date to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--end", help="Last date to rebuild (YYYY-MM-DD)")
+        parser.add_argument(
+            "--farm",
+            type=int,
+            action="append",
+            dest="farms",
+            help="Only rebuild this farm id (repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        dates = {}
+        for key in ("start", "end"):
+            value = options[key]
+            dates[key] = parse_date(value) if value else None
+            if value and dates[key] is None:
+                raise CommandError(f"Invalid --{key} date: {value}")
+
+        refreshed = backfill_milk_rollups(
+            start=dates["start"],
+            end=dates["end"],
+            farm_ids=options["farms"],
+        )
+        self.stdout.write(f"✅ Rebuilt rollups for {refreshed} cow-day(s)")
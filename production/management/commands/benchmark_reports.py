@@ -0,0 +1,205 @@
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from reportlab.platypus import Paragraph
+
+from production.utils.pdf import MilkProductionPDFReport, build_report
+from production.utils.report_data import (
+    SESSIONS,
+    CowRow,
+    DailyReportData,
+    RangeReportData,
+)
+from production.utils.report_template import ReportTemplate, get_report_template
+
+
+class BaselineTemplate(ReportTemplate):
+    """
+    The daily report as it rendered before the shared template: a markup
+    ``Paragraph`` per table cell, styles rebuilt for every report and no
+    logo. Only used as the benchmark's reference point.
+    """
+    ARROW_COLORS = {1: "green", -1: "red", 0: "grey"}
+
+    def __init__(self):
+        super().__init__()
+        self.logo = None
+
+    def delta_cell(self, value, diff, arrow=True):
+        markup = f"{value:.2f} <font size='7'>({diff:+.2f})</font>"
+        if arrow:
+            sign = (diff > 0) - (diff < 0)
+            char, _ = self.arrows[sign]
+            markup += f" <font color='{self.ARROW_COLORS[sign]}'>{char}</font>"
+        return Paragraph(markup, self.styles["Cell"])
+
+
+def synthetic_report_data(herd_size, today=None, seed=0):
+    """
+    A farm's worth of report data built in memory, so render cost can be
+    measured without a database.
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    cows = [
+        CowRow(i, f"Cow {i}" if i % 2 else "", f"TAG-{i:05d}")
+        for i in range(herd_size)
+    ]
+    values = {
+        (cow.id, day, session): Decimal(rng.randint(200, 1400)) / 100
+        for cow in cows
+        for day in (today - timedelta(days=1), today)
+        for session in SESSIONS
+    }
+    return DailyReportData(0, "Benchmark Farm", today, cows, values)
+
+
+def synthetic_range_data(herd_size, days, end=None, seed=0):
+    """
+    In-memory ``RangeReportData`` covering ``days`` days up to ``end``.
+    """
+    rng = random.Random(seed)
+    end = end or date.today()
+    start = end - timedelta(days=days - 1)
+    data = RangeReportData(
+        0,
+        "Benchmark Farm",
+        start,
+        end,
+        [CowRow(i, f"Cow {i}", f"TAG-{i:05d}") for i in range(herd_size)],
+    )
+    for cow in data.cows:
+        for day in data.days:
+            data.add(cow.id, day, [
+                Decimal(rng.randint(200, 1400)) / 100 for _ in SESSIONS
+            ])
+    return data
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-report render time, memory and PDF bytes across herd "
+        "sizes and report profiles, optionally comparing a shared (warm) "
+        "report template with one rebuilt per report (cold) and with the "
+        "pre-template renderer (baseline)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--herd-sizes",
+            default="10,100,1000,5000",
+            help="Comma-separated herd sizes",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Renders per herd size and mode",
+        )
+        parser.add_argument(
+            "--profiles",
+            default=",".join(MilkProductionPDFReport.PROFILES),
+            help="Comma-separated daily report profiles",
+        )
+        parser.add_argument(
+            "--compare-cold",
+            action="store_true",
+            help="Also render with the template rebuilt for every report",
+        )
+        parser.add_argument(
+            "--compare-baseline",
+            action="store_true",
+            help="Also render the standard daily report the way it was "
+                 "rendered before the shared template (Paragraph cells)",
+        )
+        parser.add_argument(
+            "--range-days",
+            type=int,
+            help="Benchmark the range report over this many days instead "
+                 "of the daily report",
+        )
+
+    def handle(self, *args, **options):
+        herd_sizes = [int(size) for size in options["herd_sizes"].split(",")]
+        repeat = max(1, options["repeat"])
+        modes = ("cold", "warm") if options["compare_cold"] else ("warm",)
+        if options["compare_baseline"]:
+            modes = ("baseline", *modes)
+        profiles = options["profiles"].split(",")
+        if options["range_days"]:
+            profiles = ["range"]
+
+        self.stdout.write(
+            f"{'cows':>6} {'profile':>8} {'mode':>5} {'ms/report':>10} "
+            f"{'ms/cow':>8} {'kept KiB':>10} {'peak KiB':>9} {'PDF KiB':>8} "
+            f"{'B/cow':>7}"
+        )
+        for herd_size in herd_sizes:
+            if options["range_days"]:
+                data = synthetic_range_data(herd_size, options["range_days"])
+            else:
+                data = synthetic_report_data(herd_size)
+            for profile in profiles:
+                for mode in modes:
+                    # The baseline renderer only existed for the standard
+                    # daily report
+                    if mode == "baseline" and profile != "standard":
+                        continue
+                    result = self.measure(data, profile, mode, repeat=repeat)
+                    self.stdout.write(
+                        f"{herd_size:>6} {profile:>8} {mode:>5} "
+                        f"{result['ms']:>10.1f} {result['ms'] / herd_size:>8.3f} "
+                        f"{result['retained'] / 1024:>10.0f} "
+                        f"{result['peak'] / 1024:>9.0f} "
+                        f"{result['size'] / 1024:>8.1f} "
+                        f"{result['size'] / herd_size:>7.0f}"
+                    )
+
+    def measure(self, data, profile, mode, repeat):
+        def render():
+            if mode == "cold":
+                get_report_template.cache_clear()
+            report = build_report(data, profile)
+            if mode == "baseline":
+                report.template = BaselineTemplate()
+                report.styles = report.template.styles
+            return report.render().getvalue()
+
+        # Warm imports and the shared template before timing anything
+        render()
+
+        # Timing and allocation runs are separate; tracemalloc slows rendering
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            pdf = render()
+            timings.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            snapshot_before = tracemalloc.take_snapshot()
+            render()
+            snapshot_after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # What the render left allocated afterwards (e.g. a rebuilt template)
+        retained = sum(
+            stat.size_diff
+            for stat in snapshot_after.compare_to(snapshot_before, "filename")
+            if stat.size_diff > 0
+        )
+
+        return {
+            "ms": min(timings) * 1000,
+            "retained": retained,
+            "peak": peak - before,
+            "size": len(pdf),
+        }
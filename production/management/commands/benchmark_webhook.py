@@ -0,0 +1,67 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+
+from production.views import ProductionCallBack
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure webhook acknowledgement latency under a burst of inbound "
+        "messages. Every request is rolled back, so nothing is processed "
+        "or sent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--phone", default="254700000000")
+
+    def handle(self, *args, **options):
+        view = ProductionCallBack.as_view()
+        factory = RequestFactory()
+
+        def fire(i):
+            payload = {
+                "entry": [{"changes": [{"value": {"messages": [{
+                    "id": f"wamid.bench.{uuid4().hex}",
+                    "from": options["phone"],
+                    "type": "text",
+                    "text": {"body": str(i % 3 + 1)},
+                }]}}]}],
+            }
+            request = factory.post(
+                "/production/milk-records/callback-url",
+                data=json.dumps(payload),
+                content_type="application/json",
+            )
+            try:
+                with transaction.atomic():
+                    start = time.perf_counter()
+                    view(request)
+                    elapsed = time.perf_counter() - start
+                    transaction.set_rollback(True)
+                return elapsed
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            latencies = sorted(pool.map(fire, range(options["count"])))
+        wall = time.perf_counter() - started
+
+        def pct(p):
+            index = min(len(latencies) - 1, int(round(p / 100 * len(latencies))) - 1)
+            return latencies[max(index, 0)] * 1000
+
+        self.stdout.write(
+            f"📨 {len(latencies)} webhooks, concurrency {options['concurrency']}, "
+            f"{len(latencies) / wall:.0f} req/s\n"
+            f"p50 {pct(50):.1f} ms • p95 {pct(95):.1f} ms • "
+            f"p99 {pct(99):.1f} ms • max {latencies[-1] * 1000:.1f} ms"
+        )
@@ -0,0 +1,73 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from production.models import OutboundMessage
+from production.utils.outbound import deliver_pending, requeue_stale
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued outbound WhatsApp messages from the outbox, with "
+        "retries and dead-lettering"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling instead of exiting once the outbox is drained",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Seconds between polls in --loop mode",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.OUTBOUND_WORKERS,
+            help="Messages sent concurrently",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.OUTBOUND_BATCH_SIZE,
+            help="Messages claimed per batch (SKIP LOCKED)",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stale()
+            if requeued:
+                self.stdout.write(f"🔁 Requeued {requeued} stale message(s)")
+
+            counts = deliver_pending(
+                batch_size=options["batch_size"],
+                workers=options["workers"],
+            )
+            if any(counts.values()):
+                self.stdout.write(
+                    f"✅ {counts['sent']} sent, {counts['retried']} to retry, "
+                    f"{counts['dead']} dead-lettered"
+                )
+
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+        backlog = dict(
+            OutboundMessage.objects
+            .filter(status__in=[OutboundMessage.PENDING, OutboundMessage.DEAD])
+            .values_list("status")
+            .annotate(count=Count("id"))
+            .order_by()
+        )
+        if backlog:
+            self.stdout.write(
+                f"📬 {backlog.get(OutboundMessage.PENDING, 0)} waiting for a "
+                f"retry, {backlog.get(OutboundMessage.DEAD, 0)} dead-lettered"
+            )
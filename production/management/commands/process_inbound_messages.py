@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from production.models import InboundMessage
+from production.utils.inbound import process_pending_for_phone, requeue_stale
+
+
+class Command(BaseCommand):
+    help = "Process pending inbound WhatsApp messages left by the webhook"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling instead of exiting once the queue is empty",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds between polls in --loop mode",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stale()
+            if requeued:
+                self.stdout.write(f"🔁 Requeued {requeued} stale message(s)")
+
+            phones = (
+                InboundMessage.objects
+                .filter(status=InboundMessage.PENDING)
+                .values_list("phone", flat=True)
+                .distinct()
+                .order_by()
+            )
+
+            processed = 0
+            for phone in list(phones):
+                processed += process_pending_for_phone(phone)
+
+            if processed:
+                self.stdout.write(f"✅ Processed {processed} message(s)")
+
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,155 @@
+import time
+from collections import defaultdict
+from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from accounts.models import Account
+from production.models import ReportDelivery
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver daily reports at each account's preferred local time, "
+        "spreading the work over small time slots with a per-slot cap"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run a single slot and exit (e.g. from cron every few minutes)",
+        )
+        parser.add_argument(
+            "--slot-minutes",
+            type=int,
+            default=5,
+            help="Length of a scheduling slot",
+        )
+        parser.add_argument(
+            "--slot-capacity",
+            type=int,
+            default=50,
+            help="Max farm reports started per slot; the rest roll over",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=3,
+            help="Stop retrying a delivery after this many failures",
+        )
+        parser.add_argument("--render-workers", type=int, default=1)
+        parser.add_argument("--send-workers", type=int, default=2)
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=settings.WHATSAPP_MESSAGES_PER_SECOND,
+        )
+
+    def handle(self, *args, **options):
+        slot_seconds = options["slot_minutes"] * 60
+
+        while True:
+            self.run_slot(options)
+            if options["once"]:
+                break
+            time.sleep(slot_seconds - time.time() % slot_seconds)
+
+    def run_slot(self, options):
+        due = self.due_accounts(timezone.now(), options["max_attempts"])
+
+        # Most overdue first (earliest due instant across time zones);
+        # whatever exceeds the cap waits for the next slot
+        batches = defaultdict(list)
+        budget = options["slot_capacity"]
+        for report_date, _, account in sorted(due, key=lambda item: item[1]):
+            # An account bigger than a whole slot still goes out on its own
+            if account.farm_count > budget and batches:
+                break
+            batches[report_date].append(account.id)
+            budget -= account.farm_count
+
+        if not batches:
+            return
+
+        deferred = len(due) - sum(len(ids) for ids in batches.values())
+        self.stdout.write(
+            f"🕒 Slot: {len(due) - deferred} account(s) due, {deferred} deferred"
+        )
+
+        for report_date, account_ids in batches.items():
+            call_command(
+                "send_daily_milk_reports",
+                date=str(report_date),
+                accounts=account_ids,
+                render_workers=options["render_workers"],
+                send_workers=options["send_workers"],
+                rate=options["rate"],
+                max_attempts=options["max_attempts"],
+                stdout=self.stdout,
+                stderr=self.stderr,
+            )
+
+    def due_accounts(self, now, max_attempts):
+        """
+        Return ``(local_date, due_at, account)`` for accounts whose local
+        delivery time has passed and whose report for that local day is not
+        finished yet. ``due_at`` is the aware instant the report fell due,
+        so accounts in different time zones compare correctly.
+        """
+        accounts = (
+            Account.objects
+            .filter(is_active=True)
+            .exclude(phone="")
+            .annotate(farm_count=Count("farms"))
+            .filter(farm_count__gt=0)
+        )
+
+        candidates = []
+        for account in accounts:
+            try:
+                tz = ZoneInfo(account.report_timezone)
+            except (ZoneInfoNotFoundError, ValueError):
+                tz = ZoneInfo(settings.TIME_ZONE)
+
+            local_now = now.astimezone(tz)
+            if local_now.time() >= account.report_delivery_time:
+                due_at = datetime.combine(
+                    local_now.date(), account.report_delivery_time, tzinfo=tz
+                )
+                candidates.append((local_now.date(), due_at, account))
+
+        if not candidates:
+            return []
+
+        # Deliveries that are sent, or have used up their retries
+        finished = {
+            (row["farm__account_id"], row["date"]): row["finished"]
+            for row in (
+                ReportDelivery.objects
+                .filter(
+                    farm__account_id__in=[a.id for _, _, a in candidates],
+                    date__in={d for d, _, _ in candidates},
+                    recipient=F("farm__account__phone"),
+                )
+                .values("farm__account_id", "date")
+                .annotate(finished=Count(
+                    "id",
+                    filter=Q(stage=ReportDelivery.SENT)
+                    | Q(attempts__gte=max_attempts),
+                ))
+                .order_by()
+            )
+        }
+
+        return [
+            (report_date, due_at, account)
+            for report_date, due_at, account in candidates
+            if finished.get((account.id, report_date), 0) < account.farm_count
+        ]
+
@@ -1,127 +1,512 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from datetime import date
 import os
-import requests
-from decouple import config
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
-from accounts.models import Account
+from accounts.models import Farm
+from production.models import ReportDelivery
+from production.utils.media_cache import get_or_upload_media
 from production.utils.pdf import MilkProductionPDFReport
+from production.utils.ratelimit import TokenBucket
+from production.utils.render_service import RenderService
+from production.utils.report_cache import get_or_generate_report, get_data_versions
+from production.utils.report_data import load_daily_report_data_for_farms
+from production.utils.whatsapp import (
+    get_client,
+    get_sender,
+    process_rate,
+    sender_ids,
+)
+
+
+class LeaseLost(Exception):
+    """
+    Another node took over a delivery after this node's lease expired.
+    """
 
 
 class Command(BaseCommand):
     help = "Send daily milk production reports to account phone numbers"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--render-workers",
+            type=int,
+            default=1,
+            help="Processes rendering PDFs (1 renders inline)",
+        )
+        parser.add_argument(
+            "--send-workers",
+            type=int,
+            default=1,
+            help="Threads uploading and sending over the Graph API "
+                 "(use at least one per sender number)",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=None,
+            help="Max Graph API calls per second per sender number from "
+                 "this run (defaults to this process's share of "
+                 "WHATSAPP_MESSAGES_PER_SECOND)",
+        )
+        parser.add_argument(
+            "--burst",
+            type=int,
+            default=None,
+            help="Token bucket capacity (defaults to --rate)",
+        )
+        parser.add_argument(
+            "--profile",
+            choices=MilkProductionPDFReport.PROFILES,
+            default=settings.WHATSAPP_REPORT_PROFILE,
+            help="PDF layout to send",
+        )
+        parser.add_argument(
+            "--date",
+            help="Report date (YYYY-MM-DD), defaults to today",
+        )
+        parser.add_argument(
+            "--account",
+            type=int,
+            action="append",
+            dest="accounts",
+            help="Only deliver to this account id (repeatable)",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Resend reports the delivery ledger marks as already sent",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=5,
+            help="Skip deliveries that already failed this many times "
+                 "(--force resets the count)",
+        )
+
+        # Multi-node runs: either a static shard or dynamic work claims
+        parser.add_argument(
+            "--shard-index",
+            type=int,
+            default=0,
+            help="This node's shard (0-based) when splitting farms by id",
+        )
+        parser.add_argument(
+            "--shard-count",
+            type=int,
+            default=1,
+            help="Total number of shards",
+        )
+        parser.add_argument(
+            "--claim",
+            action="store_true",
+            help="Claim deliveries in leased batches (SKIP LOCKED) instead of sharding",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Deliveries claimed per batch in --claim mode",
+        )
+        parser.add_argument(
+            "--lease-seconds",
+            type=int,
+            default=600,
+            help="How long a claimed batch stays reserved for this node",
+        )
+
     def handle(self, *args, **options):
         today = date.today()
+        if options["date"]:
+            today = parse_date(options["date"])
+            if today is None:
+                raise CommandError(f"Invalid --date: {options['date']}")
+
+        if not 0 <= options["shard_index"] < options["shard_count"]:
+            raise CommandError("--shard-index must be in [0, --shard-count)")
+        if options["claim"] and options["force"]:
+            raise CommandError("--force cannot be combined with --claim")
+        if options["rate"] is None:
+            options["rate"] = process_rate()
+        if options["rate"] <= 0:
+            raise CommandError("--rate must be greater than 0")
+        if options["burst"] is not None and options["burst"] < 1:
+            raise CommandError("--burst must be at least 1")
+        if options["max_attempts"] < 1:
+            raise CommandError("--max-attempts must be at least 1")
+
         self.stdout.write(f"📊 Sending daily farm reports for {today}")
 
-        accounts = Account.objects.filter(is_active=True)
+        self.options = options
+        # Each sender number gets its own budget, so the pool's throughput
+        # grows with the number of senders
+        senders = sender_ids()
+        for sender in senders:
+            get_client(sender).bucket = TokenBucket(
+                options["rate"], options["burst"]
+            )
+        self.stdout.write(
+            f"📤 {len(senders)} sender number(s) at {options['rate']:g} "
+            f"call(s)/s each"
+        )
+        self.output_lock = threading.Lock()
+        self.sent = 0
+        self.failures = []
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        workers = options["render_workers"]
+        self.render_service = RenderService(workers if workers > 1 else 0)
+
+        self.seed_ledger(today)
+        started = time.monotonic()
 
-        for account in accounts:
-            if not account.phone:
-                continue
+        if options["claim"]:
+            total = 0
+            attempted = set()
+            while True:
+                jobs = self.claim_batch(today, attempted)
+                if not jobs:
+                    break
+                attempted.update(delivery.pk for delivery in jobs)
+                total += len(jobs)
+                self.run_jobs(jobs, today)
+        else:
+            jobs = self.collect_jobs(today, options["force"])
+            total = len(jobs)
+            self.run_jobs(jobs, today)
 
-            farms = account.farms.all()
-            if not farms.exists():
-                continue
+        self.render_service.shutdown()
+        self.write_summary(total, time.monotonic() - started)
 
-            for farm in farms:
+    def run_jobs(self, jobs, today):
+        options = self.options
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, options["send_workers"]),
+            thread_name_prefix="report-send",
+        ) as send_pool:
+            send_futures = {}
+            for delivery, pdf_path in self.render_reports(
+                jobs, today, options["render_workers"]
+            ):
+                future = send_pool.submit(
+                    self.send_farm_report, delivery, pdf_path
+                )
+                send_futures[future] = delivery
+
+            for future in as_completed(send_futures):
+                delivery = send_futures[future]
                 try:
-                    self.send_farm_report(account, farm)
-                    self.stdout.write(
-                        f"✅ Sent report for farm '{farm.name}' to {account.phone}"
-                    )
+                    future.result()
+                    self.report_success(delivery)
+                except LeaseLost:
+                    # Not a failure: the new lease holder delivers it
+                    with self.output_lock:
+                        self.stdout.write(
+                            f"↪️  Farm '{delivery.farm.name}' was taken over "
+                            f"by another node"
+                        )
                 except Exception as e:
-                    self.stderr.write(
-                        f"❌ Failed for farm '{farm.name}' ({account.phone}): {e}"
-                    )
+                    self.report_failure(delivery, e)
 
     # --------------------------------------------------
-    # WhatsApp helpers
+    # Pipeline
     # --------------------------------------------------
-    def send_farm_report(self, account, farm):
-        from django.conf import settings
-
-        # 1️⃣ Generate PDF
-        report = MilkProductionPDFReport(farm)
-        pdf_path = report.generate()
-
-        # 2️⃣ Upload PDF
-        media_id = self.upload_pdf(pdf_path)
-
-        # 3️⃣ Send intro message
-        self.send_text(
-            account.phone,
-            (
-                f"📊 *Daily Milk Production Report*\n\n"
-                f"Farm: {farm.name}\n"
-                f"Date: {timezone.now().date()}\n\n"
-                f"📄 Detailed report attached below."
+    def seed_ledger(self, report_date):
+        """
+        Make sure every active farm has a ledger row for the day. Safe to
+        run from several nodes at once.
+        """
+        farms = (
+            Farm.objects
+            .filter(account__is_active=True)
+            .exclude(account__phone="")
+            .select_related("account")
+        )
+        if self.options["accounts"]:
+            farms = farms.filter(account_id__in=self.options["accounts"])
+        ReportDelivery.objects.bulk_create(
+            [
+                ReportDelivery(
+                    farm=farm, date=report_date, recipient=farm.account.phone
+                )
+                for farm in farms
+            ],
+            ignore_conflicts=True,
+        )
+
+    def deliveries(self, report_date):
+        deliveries = ReportDelivery.objects.filter(
+            date=report_date,
+            farm__account__is_active=True,
+            recipient=F("farm__account__phone"),
+        )
+        if self.options["accounts"]:
+            deliveries = deliveries.filter(
+                farm__account_id__in=self.options["accounts"]
+            )
+        return deliveries
+
+    def collect_jobs(self, report_date, force=False):
+        """
+        Return this shard's deliveries that still have work left.
+        """
+        deliveries = (
+            self.deliveries(report_date)
+            .annotate(shard=F("farm_id") % self.options["shard_count"])
+            .filter(shard=self.options["shard_index"])
+            .select_related("farm", "farm__account")
+            .order_by("farm__account_id", "farm_id")
+        )
+
+        if force:
+            ReportDelivery.objects.filter(
+                pk__in=list(deliveries.values_list("pk", flat=True))
+            ).update(stage=ReportDelivery.PENDING, media_id="", attempts=0)
+            return list(deliveries)
+
+        unsent = deliveries.exclude(stage=ReportDelivery.SENT)
+        jobs = list(unsent.filter(attempts__lt=self.options["max_attempts"]))
+        skipped = deliveries.count() - unsent.count()
+        if skipped:
+            self.stdout.write(f"⏭️  {skipped} report(s) already delivered today")
+        exhausted = unsent.count() - len(jobs)
+        if exhausted:
+            self.stdout.write(
+                f"🛑 {exhausted} report(s) skipped after "
+                f"{self.options['max_attempts']} failed attempts"
+            )
+        return jobs
+
+    def claim_batch(self, report_date, attempted):
+        """
+        Lease the next batch of unfinished deliveries to this node.
+
+        ``SKIP LOCKED`` lets concurrent nodes claim disjoint batches, and
+        the lease keeps a batch reserved after the claim commits. Leases
+        of crashed nodes expire and are picked up again; ``hold_lease``
+        renews a delivery's lease before each message goes out.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                self.deliveries(report_date)
+                .exclude(stage=ReportDelivery.SENT)
+                .exclude(pk__in=attempted)
+                .filter(attempts__lt=self.options["max_attempts"])
+                .filter(
+                    Q(lease_expires_at__isnull=True)
+                    | Q(lease_expires_at__lt=now)
+                    | Q(lease_owner=self.worker_id)
+                )
+                .select_for_update(skip_locked=True, of=("self",))
+                .select_related("farm", "farm__account")
+                .order_by("id")[:self.options["batch_size"]]
+            )
+            ReportDelivery.objects.filter(
+                pk__in=[delivery.pk for delivery in batch]
+            ).update(
+                lease_owner=self.worker_id,
+                lease_expires_at=now + timedelta(
+                    seconds=self.options["lease_seconds"]
+                ),
+            )
+        return batch
+
+    def hold_lease(self, delivery):
+        """
+        In ``--claim`` mode, extend this node's lease on ``delivery`` so it
+        covers the next send, or raise ``LeaseLost`` if the lease expired
+        and another node claimed the delivery meanwhile.
+
+        The renewal is one conditional UPDATE, so at most one node holds a
+        delivery when it sends.
+        """
+        if not self.options["claim"]:
+            return
+        renewed = ReportDelivery.objects.filter(
+            pk=delivery.pk, lease_owner=self.worker_id
+        ).update(
+            lease_expires_at=timezone.now() + timedelta(
+                seconds=self.options["lease_seconds"]
             ),
         )
+        if not renewed:
+            raise LeaseLost(delivery.pk)
 
-        # 4️⃣ Send PDF
-        self.send_pdf(account.phone, media_id)
+    def render_reports(self, jobs, report_date, workers):
+        """
+        Yield ``(delivery, pdf_path)`` as renders finish, so sending starts
+        while later farms are still rendering. Renders recorded in the
+        ledger are reused while the file is still on disk, and uploaded
+        reports are sent by media id without their file.
+        """
+        pending = []
+        for delivery in jobs:
+            uploaded = delivery.reached(ReportDelivery.UPLOADED) and delivery.media_id
+            if uploaded or (
+                delivery.reached(ReportDelivery.RENDERED)
+                and os.path.exists(delivery.pdf_path)
+            ):
+                yield delivery, delivery.pdf_path
+            else:
+                pending.append(delivery)
 
-    def upload_pdf(self, file_path):
-        from django.conf import settings
+        for delivery, pdf_path in self.render_pending(pending, report_date, workers):
+            delivery.advance(
+                ReportDelivery.RENDERED,
+                pdf_path=pdf_path,
+                rendered_at=timezone.now(),
+            )
+            yield delivery, pdf_path
 
-        url = f"https://graph.facebook.com/v18.0/{config('PHONE_NUMBER_ID')}/media"
+    def render_pending(self, jobs, report_date, workers):
+        if not jobs:
+            return
 
-        headers = {
-            "Authorization": f"Bearer {config('WHATS_APP_API_KEY')}",
-        }
+        # Herds, rollups and cache versions for every farm in a few
+        # grouped queries, rather than per farm inside each render
+        farms = [delivery.farm for delivery in jobs]
+        datasets = load_daily_report_data_for_farms(farms, report_date)
+        versions = get_data_versions([farm.id for farm in farms], report_date)
 
-        with open(file_path, "rb") as f:
-            response = requests.post(
-                url,
-                headers=headers,
-                files={
-                    "file": (
-                        os.path.basename(file_path),
-                        f,
-                        "application/pdf",
-                    )
-                },
-                data={"messaging_product": "whatsapp"},
+        def render(delivery):
+            return get_or_generate_report(
+                delivery.farm,
+                report_date,
+                data=datasets[delivery.farm_id],
+                version=versions[delivery.farm_id],
+                service=self.render_service,
+                profile=self.options["profile"],
             )
 
-        response.raise_for_status()
-        return response.json()["id"]
+        if workers <= 1:
+            for delivery in jobs:
+                try:
+                    yield delivery, render(delivery)
+                except Exception as e:
+                    self.report_failure(delivery, e)
+            return
+
+        def render_in_thread(delivery):
+            try:
+                return render(delivery)
+            finally:
+                connection.close()
 
-    def send_text(self, phone, text):
-        from django.conf import settings
+        # Threads only wait on the render processes and the cache lock
+        with ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="report-render",
+        ) as render_pool:
+            futures = {
+                render_pool.submit(render_in_thread, delivery): delivery
+                for delivery in jobs
+            }
+            for future in as_completed(futures):
+                delivery = futures[future]
+                try:
+                    yield delivery, future.result()
+                except Exception as e:
+                    self.report_failure(delivery, e)
+
+    def report_success(self, delivery):
+        with self.output_lock:
+            self.sent += 1
+            self.stdout.write(
+                f"✅ Sent report for farm '{delivery.farm.name}' to {delivery.recipient}"
+            )
 
-        requests.post(
-            f"https://graph.facebook.com/v18.0/{config('PHONE_NUMBER_ID')}/messages",
-            headers={
-                "Authorization": f"Bearer {config('WHATS_APP_API_KEY')}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "messaging_product": "whatsapp",
-                "to": phone,
-                "text": {"body": text},
-            },
+    def report_failure(self, delivery, error):
+        ReportDelivery.objects.filter(pk=delivery.pk).update(
+            attempts=F("attempts") + 1,
+            last_error=repr(error),
         )
+        with self.output_lock:
+            self.failures.append((delivery, error))
+            self.stderr.write(
+                f"❌ Failed for farm '{delivery.farm.name}' ({delivery.recipient}): {error}"
+            )
+
+    def write_summary(self, total, elapsed):
+        rate = self.sent / elapsed * 60 if elapsed else 0
+        self.stdout.write(
+            f"\n📈 {self.sent}/{total} reports sent, {len(self.failures)} failed "
+            f"in {elapsed:.1f}s ({rate:.1f} reports/min)"
+        )
+        stats = self.render_service.stats()
+        if stats["completed"]:
+            self.stdout.write(
+                f"🖨️  {stats['completed']} render(s), "
+                f"avg {stats['render_ms_avg']}ms, p95 {stats['render_ms_p95']}ms, "
+                f"queue wait p95 {stats['wait_ms_p95']}ms"
+            )
+        for delivery, error in self.failures:
+            self.stdout.write(
+                f"   • {delivery.farm.name} ({delivery.recipient}): {error}"
+            )
+
+    # --------------------------------------------------
+    # WhatsApp helpers
+    # --------------------------------------------------
+    def send_farm_report(self, delivery, pdf_path):
+        """
+        Upload and send one report, skipping stages the ledger already
+        records as done.
+        """
+        try:
+            # 1️⃣ Upload PDF (reusing the stored media id on resume)
+            if not delivery.reached(ReportDelivery.UPLOADED) or not delivery.media_id:
+                self.hold_lease(delivery)
+                delivery.advance(
+                    ReportDelivery.UPLOADED,
+                    media_id=self.upload_pdf(pdf_path, delivery.recipient),
+                    uploaded_at=timezone.now(),
+                )
+
+            # 2️⃣ Send intro message
+            if not delivery.reached(ReportDelivery.NOTIFIED):
+                self.hold_lease(delivery)
+                self.send_text(
+                    delivery.recipient,
+                    (
+                        f"📊 *Daily Milk Production Report*\n\n"
+                        f"Farm: {delivery.farm.name}\n"
+                        f"Date: {delivery.date}\n\n"
+                        f"📄 Detailed report attached below."
+                    ),
+                )
+                delivery.advance(ReportDelivery.NOTIFIED)
+
+            # 3️⃣ Send PDF
+            self.hold_lease(delivery)
+            self.send_pdf(delivery.recipient, delivery.media_id)
+            delivery.advance(ReportDelivery.SENT, sent_at=timezone.now())
+        finally:
+            # Send threads own their connections; don't leak them
+            connection.close()
+
+    # Every call goes out from the recipient's own sender number, which
+    # rate-limits itself; media ids belong to the number that uploaded them
+    def upload_pdf(self, file_path, phone):
+        # Recipients of the same report share one upload per sender
+        return get_or_upload_media(file_path, client=get_sender(phone))
+
+    def send_text(self, phone, text):
+        get_sender(phone).send_text(phone, text)
 
     def send_pdf(self, phone, media_id):
-        from django.conf import settings
-
-        requests.post(
-            f"https://graph.facebook.com/v18.0/{config('PHONE_NUMBER_ID')}/messages",
-            headers={
-                "Authorization": f"Bearer {config('WHATS_APP_API_KEY')}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "messaging_product": "whatsapp",
-                "to": phone,
-                "type": "document",
-                "document": {
-                    "id": media_id,
-                    "caption": "📊 Daily Milk Production Report",
-                },
-            },
+        get_sender(phone).send_document(
+            phone, media_id, "📊 Daily Milk Production Report"
         )
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from production.utils.media_cache import purge_expired_media
+from production.utils.report_cache import sweep_reports
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply retention to MEDIA_ROOT/reports: drop loose report files, "
+        "stale render temp files and cache entries over the age/size limits, "
+        "and forget expired WhatsApp media ids"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age-days",
+            type=int,
+            default=settings.REPORT_CACHE_MAX_AGE_DAYS,
+            help="Remove cached reports not used for this many days",
+        )
+        parser.add_argument(
+            "--max-bytes",
+            type=int,
+            default=settings.REPORT_CACHE_MAX_BYTES,
+            help="Evict least recently used reports above this cache size",
+        )
+        parser.add_argument(
+            "--min-age-minutes",
+            type=int,
+            default=settings.REPORT_SWEEP_MIN_AGE_MINUTES,
+            help="Leave loose and temp files younger than this alone",
+        )
+
+    def handle(self, *args, **options):
+        loose, temp, evicted = sweep_reports(
+            max_age_days=options["max_age_days"],
+            max_bytes=options["max_bytes"],
+            min_age_minutes=options["min_age_minutes"],
+        )
+        self.stdout.write(
+            f"🧹 Removed {loose} loose report(s), {temp} temp file(s) "
+            f"and {evicted} cache entr{'y' if evicted == 1 else 'ies'}"
+        )
+        expired = purge_expired_media()
+        self.stdout.write(f"🧹 Forgot {expired} expired WhatsApp media id(s)")
@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-17 08:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0003_alter_milkrecord_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='milkrecord',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0005_inboundmessage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='milkrecord',
+            index=models.Index(fields=['date', 'created_at', 'id'], name='production__date_b48d82_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='milkrecord',
+            index=models.Index(fields=['cow', 'date', 'created_at', 'id'], name='production__cow_id_bbbe39_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_remove_cow_is_pregnant_cow_current_lactation_number_and_more'),
+        ('production', '0006_milkrecord_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FarmDailyMilk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('session', models.CharField(choices=[('morning', 'Morning'), ('evening', 'Evening'), ('afternoon', 'Afternoon')], max_length=10)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('record_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('farm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_milk', to='accounts.farm')),
+            ],
+            options={
+                'unique_together': {('farm', 'date', 'session')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CowDailyMilk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('morning', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('afternoon', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('evening', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('cow', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_milk', to='accounts.cow')),
+                ('farm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cow_daily_milk', to='accounts.farm')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['farm', 'date'], name='production__farm_id_63c13f_idx')],
+                'unique_together': {('cow', 'date')},
+            },
+        ),
+    ]
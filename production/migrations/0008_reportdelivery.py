@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_remove_cow_is_pregnant_cow_current_lactation_number_and_more'),
+        ('production', '0007_milk_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('recipient', models.CharField(max_length=20)),
+                ('stage', models.CharField(choices=[('pending', 'Pending'), ('rendered', 'Rendered'), ('uploaded', 'Uploaded'), ('notified', 'Notified'), ('sent', 'Sent')], default='pending', max_length=20)),
+                ('pdf_path', models.CharField(blank=True, max_length=500)),
+                ('media_id', models.CharField(blank=True, max_length=128)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('rendered_at', models.DateTimeField(blank=True, null=True)),
+                ('uploaded_at', models.DateTimeField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('farm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_deliveries', to='accounts.farm')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'stage'], name='production__date_348f50_idx')],
+                'unique_together': {('farm', 'date', 'recipient')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0008_reportdelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportdelivery',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reportdelivery',
+            name='lease_owner',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-17 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0009_reportdelivery_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WhatsAppMedia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_number_id', models.CharField(max_length=64)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('media_id', models.CharField(max_length=128)),
+                ('size', models.PositiveIntegerField()),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'WhatsApp Media',
+                'verbose_name_plural': 'WhatsApp Media',
+                'unique_together': {('phone_number_id', 'content_hash')},
+            },
+        ),
+    ]
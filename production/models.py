@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.conf import settings
 from accounts.models import Cow, Farm
 
@@ -39,15 +40,56 @@ class MilkRecord(models.Model):
     )
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
         ordering = ["-date", "-created_at"]
         unique_together = ("cow", "date", "session")
+        indexes = [
+            # Keyset pagination over (date, created_at, id)
+            models.Index(fields=["date", "created_at", "id"]),
+            models.Index(fields=["cow", "date", "created_at", "id"]),
+        ]
         verbose_name = "Milk Record"
         verbose_name_plural = "Milk Records"
 
     def __str__(self):
         return f"{self.cow} | {self.date} | {self.session} | {self.quantity_in_liters}L"
 
+    # Keep CowDailyMilk / FarmDailyMilk in step with single-record writes.
+    # Set-based writes go through production.utils.records instead.
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._rollup_key = (
+            instance.__dict__.get("cow_id"), instance.__dict__.get("date")
+        )
+        return instance
+
+    def _rollup_keys(self):
+        keys = {(self.cow_id, self.date)}
+        loaded = getattr(self, "_rollup_key", None)
+        if loaded and None not in loaded:
+            keys.add(loaded)
+        return keys
+
+    def save(self, *args, **kwargs):
+        from production.utils.rollups import refresh_milk_rollups
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            refresh_milk_rollups(self._rollup_keys())
+        self._rollup_key = (self.cow_id, self.date)
+
+    def delete(self, *args, **kwargs):
+        from production.utils.rollups import refresh_milk_rollups
+
+        keys = self._rollup_keys()
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            refresh_milk_rollups(keys)
+        return result
+
 class ChatSession(models.Model):
     phone = models.CharField(max_length=20, unique=True)
     farm = models.ForeignKey(
@@ -56,3 +98,242 @@ class ChatSession(models.Model):
     step = models.CharField(max_length=50, default="start")
     data = models.JSONField(default=dict)
     updated_at = models.DateTimeField(auto_now=True)
+
+
+class InboundMessage(models.Model):
+    """
+    WhatsApp message persisted by the webhook and processed in the
+    background.
+    """
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (PROCESSING, "Processing"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+    # WhatsApp message id, used to drop Meta's webhook retries
+    wa_message_id = models.CharField(
+        max_length=128, unique=True, null=True, blank=True
+    )
+    phone = models.CharField(max_length=20)
+    text = models.TextField()
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["phone", "status"]),
+        ]
+
+    def __str__(self):
+        return f"{self.phone} | {self.status} | {self.text[:20]}"
+
+
+class CowDailyMilk(models.Model):
+    """
+    Per-cow, per-day milk rollup, kept in step with MilkRecord writes.
+    """
+    cow = models.ForeignKey(
+        Cow,
+        on_delete=models.CASCADE,
+        related_name="daily_milk"
+    )
+    farm = models.ForeignKey(
+        Farm,
+        on_delete=models.CASCADE,
+        related_name="cow_daily_milk"
+    )
+    date = models.DateField()
+    morning = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    afternoon = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    evening = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("cow", "date")
+        indexes = [
+            models.Index(fields=["farm", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.cow_id} | {self.date} | {self.total}L"
+
+
+class FarmDailyMilk(models.Model):
+    """
+    Per-farm, per-day, per-session milk rollup.
+    """
+    farm = models.ForeignKey(
+        Farm,
+        on_delete=models.CASCADE,
+        related_name="daily_milk"
+    )
+    date = models.DateField()
+    session = models.CharField(
+        max_length=10,
+        choices=MilkRecord.SESSION_CHOICES
+    )
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    record_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("farm", "date", "session")
+
+    def __str__(self):
+        return f"{self.farm_id} | {self.date} | {self.session} | {self.total}L"
+
+
+class ReportDelivery(models.Model):
+    """
+    Ledger of daily report deliveries, one row per farm, date and
+    recipient, recording how far each delivery got.
+    """
+    PENDING = "pending"
+    RENDERED = "rendered"
+    UPLOADED = "uploaded"
+    NOTIFIED = "notified"
+    SENT = "sent"
+    STAGE_CHOICES = [
+        (PENDING, "Pending"),
+        (RENDERED, "Rendered"),
+        (UPLOADED, "Uploaded"),
+        (NOTIFIED, "Notified"),
+        (SENT, "Sent"),
+    ]
+    STAGE_ORDER = [PENDING, RENDERED, UPLOADED, NOTIFIED, SENT]
+
+    farm = models.ForeignKey(
+        Farm,
+        on_delete=models.CASCADE,
+        related_name="report_deliveries"
+    )
+    date = models.DateField()
+    recipient = models.CharField(max_length=20)
+    stage = models.CharField(
+        max_length=20,
+        choices=STAGE_CHOICES,
+        default=PENDING,
+    )
+    pdf_path = models.CharField(max_length=500, blank=True)
+    media_id = models.CharField(max_length=128, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Work claim for multi-node runs (send_daily_milk_reports --claim)
+    lease_owner = models.CharField(max_length=255, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    rendered_at = models.DateTimeField(null=True, blank=True)
+    uploaded_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("farm", "date", "recipient")
+        indexes = [
+            models.Index(fields=["date", "stage"]),
+        ]
+
+    def __str__(self):
+        return f"{self.farm_id} | {self.date} | {self.recipient} | {self.stage}"
+
+    def reached(self, stage):
+        return self.STAGE_ORDER.index(self.stage) >= self.STAGE_ORDER.index(stage)
+
+    def advance(self, stage, **fields):
+        # Never move backwards: a late re-render must not undo an upload
+        if not self.reached(stage):
+            self.stage = stage
+        self.last_error = ""
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.save(update_fields=[
+            "stage", "last_error", "updated_at", *fields.keys()
+        ])
+
+
+class WhatsAppMedia(models.Model):
+    """
+    Graph API media id of an uploaded document, keyed by the sending
+    number and a hash of the file, so identical reports are uploaded once
+    and sent to every recipient by id until the media expires.
+    """
+    phone_number_id = models.CharField(max_length=64)
+    content_hash = models.CharField(max_length=64)
+    media_id = models.CharField(max_length=128)
+    size = models.PositiveIntegerField()
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ("phone_number_id", "content_hash")
+        verbose_name = "WhatsApp Media"
+        verbose_name_plural = "WhatsApp Media"
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} | {self.media_id} | {self.expires_at}"
+
+
+class OutboundMessage(models.Model):
+    """
+    Outbox of WhatsApp messages. Rows are written in the same transaction
+    as the state change they announce and delivered afterwards by
+    production.utils.outbound, so handlers never wait on the Graph API
+    and a crash loses nothing.
+    """
+    TEXT = "text"
+    REPORT = "report"
+    KIND_CHOICES = [
+        (TEXT, "Text"),
+        (REPORT, "Report PDF"),
+    ]
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    DEAD = "dead"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENDING, "Sending"),
+        (SENT, "Sent"),
+        (DEAD, "Dead"),
+    ]
+    phone = models.CharField(max_length=20)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=TEXT)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    wa_message_id = models.CharField(max_length=128, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+            models.Index(fields=["phone", "status"]),
+        ]
+
+    def __str__(self):
+        return f"{self.phone} | {self.kind} | {self.status}"
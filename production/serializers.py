@@ -29,3 +29,14 @@ class MilkRecordSerializer(serializers.ModelSerializer):
                 "Milk quantity must be greater than zero."
             )
         return value
+
+
+class MilkRecordBulkSerializer(MilkRecordSerializer):
+    """
+    Row validation for bulk uploads without per-row queries: cows are
+    resolved set-wise and uniqueness is handled by the upsert.
+    """
+    cow = serializers.IntegerField()
+
+    class Meta(MilkRecordSerializer.Meta):
+        validators = []
@@ -1,3 +1,1350 @@
-from django.test import TestCase
+import json
+import os
+from collections import Counter
+from io import BytesIO, StringIO
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from datetime import date, datetime, timedelta
+from datetime import time as dt_time
+from datetime import timezone as dt_timezone
+from decimal import Decimal
 
-# Create your tests here.
+import requests
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from reportlab import rl_config
+from reportlab.pdfgen.canvas import Canvas
+from rest_framework.test import APIClient
+
+from accounts.models import Account, Farm, Cow, User
+from production.management.commands.run_report_scheduler import (
+    Command as ReportScheduler,
+)
+from production.management.commands.send_daily_milk_reports import (
+    Command as SendDailyReports,
+    LeaseLost,
+)
+from production.models import (
+    CowDailyMilk,
+    FarmDailyMilk,
+    InboundMessage,
+    MilkRecord,
+    OutboundMessage,
+    ReportDelivery,
+    WhatsAppMedia,
+)
+from production.utils.inbound import process_pending_for_phone
+from production.utils.inbound import _run_in_worker as inbound_worker
+from production.utils.media_cache import get_or_upload_media
+from production.utils.outbound import deliver_pending, enqueue_text
+from production.utils.whatsapp import (
+    CircuitOpenError,
+    WhatsAppClient,
+    get_client,
+    get_sender,
+)
+from production.utils.pdf import MilkProductionPDFReport, build_report
+from production.utils.ratelimit import TokenBucket
+from production.utils.report_template import get_report_template
+from production.utils.report_cache import (
+    get_data_version,
+    get_data_versions,
+    get_or_generate_report,
+    prewarm_report,
+    sweep_reports,
+)
+from production.utils.report_data import (
+    load_daily_report_data,
+    load_daily_report_data_for_farms,
+    load_range_report_data,
+    report_period,
+)
+from production.utils.render_service import RenderService, RenderTimeout
+from production.utils.rollups import backfill_milk_rollups
+from production.utils.singleflight import SingleFlightTimeout, single_flight
+from production.utils.summary import format_daily_summary
+from production.views import ProductionCallBack
+
+
+class ProductionTestMixin:
+    """
+    Shared fixtures for production tests.
+    """
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, REPORT_RENDER_WORKERS=0
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.account = Account.objects.create(
+            account_type=Account.INDIVIDUAL,
+            name="Test Account",
+            phone="254700000000",
+        )
+        self.today = date.today()
+        self.yesterday = self.today - timedelta(days=1)
+
+    def make_farm(self, name, herd_size, account=None):
+        farm = Farm.objects.create(
+            account=account or self.account,
+            name=name,
+            location="Nakuru",
+            size_in_acres=Decimal("10.00"),
+        )
+        cows = Cow.objects.bulk_create([
+            Cow(
+                farm=farm,
+                tag_number=f"{name}-{i}",
+                name=f"Cow {i}" if i % 2 else "",
+                breed="Friesian",
+                date_of_birth=date(2020, 1, 1),
+            )
+            for i in range(herd_size)
+        ])
+        MilkRecord.objects.bulk_create([
+            MilkRecord(
+                cow=cow,
+                date=day,
+                session=session,
+                quantity_in_liters=Decimal("5.50"),
+            )
+            for cow in cows
+            for day in (self.today, self.yesterday)
+            for session in (MilkRecord.MORNING, MilkRecord.EVENING)
+        ])
+        backfill_milk_rollups(farm_ids=[farm.id])
+        return farm
+
+
+class DailyReportDataTests(ProductionTestMixin, TestCase):
+    def test_pivot_totals(self):
+        farm = self.make_farm("pivot", 3)
+        data = load_daily_report_data(farm, self.today)
+        cow = data.cows[0]
+
+        self.assertEqual(len(data.cows), 3)
+        self.assertEqual(
+            data.value(cow.id, MilkRecord.MORNING, self.today), Decimal("5.50")
+        )
+        self.assertEqual(
+            data.value(cow.id, MilkRecord.AFTERNOON, self.today), Decimal("0")
+        )
+        self.assertEqual(data.cow_total(cow.id, self.yesterday), Decimal("11.00"))
+        self.assertEqual(
+            data.session_total(MilkRecord.EVENING, self.today), Decimal("16.50")
+        )
+        self.assertEqual(data.total(self.today), Decimal("33.00"))
+
+    def test_report_query_count_is_flat(self):
+        small = self.make_farm("small", 5)
+        large = self.make_farm("large", 60)
+
+        with CaptureQueriesContext(connection) as small_queries:
+            MilkProductionPDFReport(small).render()
+
+        with CaptureQueriesContext(connection) as large_queries:
+            MilkProductionPDFReport(large).render()
+
+        self.assertEqual(len(small_queries), len(large_queries))
+        self.assertLessEqual(len(large_queries), 2)
+
+    def test_batch_load_is_constant_in_farm_count(self):
+        farms = [self.make_farm(f"batch{i}", 4) for i in range(5)]
+
+        with self.assertNumQueries(4):
+            datasets = load_daily_report_data_for_farms(farms, self.today)
+            get_data_versions([farm.id for farm in farms], self.today)
+
+        self.assertEqual(set(datasets), {farm.id for farm in farms})
+        self.assertEqual(datasets[farms[2].id].total(self.today), Decimal("44.00"))
+
+
+class ReportCacheTests(ProductionTestMixin, TestCase):
+    def test_cache_hit_until_data_changes(self):
+        farm = self.make_farm("cache", 3)
+
+        first = get_or_generate_report(farm, self.today)
+        self.assertEqual(get_or_generate_report(farm, self.today), first)
+
+        record = MilkRecord.objects.filter(cow__farm=farm).first()
+        record.quantity_in_liters = Decimal("7.25")
+        record.save()
+
+        second = get_or_generate_report(farm, self.today)
+        self.assertNotEqual(second, first)
+        self.assertFalse(os.path.exists(first))
+
+    def test_concurrent_callers_share_one_render(self):
+        farm = self.make_farm("flight", 2)
+        data = load_daily_report_data(farm, self.today)
+        version = get_data_version(farm, self.today)
+        renders = []
+
+        def slow_render(*args, **kwargs):
+            renders.append(threading.current_thread().name)
+            time.sleep(0.3)
+            return b"%PDF-1.4 stub"
+
+        with mock.patch(
+            "production.utils.report_cache.render_report", side_effect=slow_render
+        ), ThreadPoolExecutor(max_workers=5) as pool:
+            paths = list(pool.map(
+                lambda _: get_or_generate_report(
+                    farm, self.today, data=data, version=version
+                ),
+                range(5),
+            ))
+
+        self.assertEqual(len(renders), 1)
+        self.assertEqual(len(set(paths)), 1)
+
+    @override_settings(REPORT_LOCK_TIMEOUT=0.2)
+    def test_waiting_past_the_lock_timeout_raises(self):
+        farm = self.make_farm("busy", 1)
+        key = f"milk-report:{farm.id}:{self.today}:standard"
+
+        with single_flight(key):
+            with self.assertRaises(SingleFlightTimeout):
+                get_or_generate_report(farm, self.today)
+
+    def test_advisory_lock_times_out_when_held(self):
+        # PostgreSQL path, with another session holding the lock
+        with mock.patch("production.utils.singleflight.connection") as db:
+            db.vendor = "postgresql"
+            cursor = db.cursor.return_value.__enter__.return_value
+            cursor.fetchone.return_value = (False,)
+
+            with self.assertRaises(SingleFlightTimeout):
+                with single_flight("busy", timeout=0.05, poll_interval=0.01):
+                    pass
+        cursor.execute.assert_called_with(
+            "SELECT pg_try_advisory_lock(%s)", mock.ANY
+        )
+        self.assertGreater(cursor.execute.call_count, 1)
+
+
+class RenderServiceTests(ProductionTestMixin, TestCase):
+    def test_renders_payloads_in_worker_processes(self):
+        farm = self.make_farm("service", 4)
+        data = load_daily_report_data(farm, self.today)
+
+        service = RenderService(workers=1, timeout=60)
+        self.addCleanup(service.shutdown)
+
+        futures = [service.submit(data) for _ in range(3)]
+        for future in futures:
+            self.assertTrue(future.result(timeout=60).startswith(b"%PDF"))
+
+        stats = service.stats()
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertEqual(stats["completed"], 3)
+        self.assertIsNotNone(stats["render_ms_p95"])
+
+    def test_times_out(self):
+        farm = self.make_farm("slow", 1)
+        data = load_daily_report_data(farm, self.today)
+
+        service = RenderService(workers=1)
+        self.addCleanup(service.shutdown)
+
+        with self.assertRaises(RenderTimeout):
+            service.render(data, timeout=0.001)
+        self.assertEqual(service.stats()["timed_out"], 1)
+
+    def test_replaces_a_broken_pool(self):
+        farm = self.make_farm("broken", 2)
+        data = load_daily_report_data(farm, self.today)
+
+        service = RenderService(workers=1, timeout=60)
+        self.addCleanup(service.shutdown)
+        self.assertTrue(service.render(data).startswith(b"%PDF"))
+
+        # A worker killed (e.g. by the OOM killer) breaks the whole pool
+        pool = service.pool
+        for process in list(pool._processes.values()):
+            process.kill()
+            process.join()
+
+        with self.assertLogs("production.utils.render_service", "WARNING"):
+            self.assertTrue(service.render(data).startswith(b"%PDF"))
+        self.assertIsNot(service.pool, pool)
+        self.assertEqual(service.stats()["restarts"], 1)
+
+    @override_settings(REPORT_RENDER_STATS_INTERVAL=60)
+    def test_logs_stats_periodically(self):
+        farm = self.make_farm("stats", 1)
+        data = load_daily_report_data(farm, self.today)
+        service = RenderService(workers=0)
+
+        with self.assertNoLogs("production.utils.render_service", "INFO"):
+            service.render(data)
+
+        service._stats_logged_at -= 60
+        with self.assertLogs("production.utils.render_service", "INFO") as logs:
+            service.render(data)
+        self.assertIn("'queue_depth': 0", logs.output[0])
+
+
+class ReportTemplateTests(ProductionTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        get_report_template.cache_clear()
+        self.addCleanup(get_report_template.cache_clear)
+
+    def test_reports_share_one_template(self):
+        farm = self.make_farm("template", 2)
+        data = load_daily_report_data(farm, self.today)
+
+        first, second = build_report(data), build_report(data)
+        self.assertIs(first.template, second.template)
+        self.assertIs(first.template, get_report_template())
+
+        get_report_template.cache_clear()
+        self.assertIsNot(build_report(data).template, first.template)
+
+    def test_logo_drawn_on_first_page_only(self):
+        farm = self.make_farm("pages", 120)
+        data = load_daily_report_data(farm, self.today)
+        report = build_report(data)
+        self.assertIsNotNone(report.template.logo)
+
+        with mock.patch.object(
+            Canvas, "drawImage", autospec=True
+        ) as draw_image, mock.patch.object(
+            Canvas, "showPage", autospec=True, side_effect=Canvas.showPage
+        ) as show_page:
+            report.render()
+
+        self.assertGreater(show_page.call_count, 1)
+        self.assertEqual(draw_image.call_count, 1)
+
+
+class MobileReportTests(ProductionTestMixin, TestCase):
+    def render_size(self, data, charts=True):
+        report = build_report(data, "mobile")
+        report.charts = charts
+        buffer = BytesIO()
+        report._build(buffer)
+        return buffer.getbuffer().nbytes
+
+    def test_render_stays_within_budget(self):
+        farm = self.make_farm("mobile", 30)
+        data = load_daily_report_data(farm, self.today)
+        full = self.render_size(data)
+        bare = self.render_size(data, charts=False)
+        self.assertLess(bare, full)
+
+        with override_settings(REPORT_MOBILE_MAX_BYTES=full - 1):
+            report = build_report(data, "mobile")
+            pdf = report.render().getvalue()
+        self.assertFalse(report.charts)
+        self.assertLessEqual(len(pdf), full - 1)
+
+        with override_settings(REPORT_MOBILE_MAX_BYTES=bare - 1):
+            with self.assertLogs("production.utils.pdf", "WARNING"):
+                self.assertEqual(len(build_report(data, "mobile").render().getvalue()), bare)
+
+    def test_binary_streams_are_scoped_to_the_mobile_build(self):
+        farm = self.make_farm("a85", 3)
+        data = load_daily_report_data(farm, self.today)
+        use_a85 = rl_config.useA85
+
+        self.assertNotIn(b"ASCII85Decode", build_report(data, "mobile").render().getvalue())
+        self.assertEqual(rl_config.useA85, use_a85)
+
+
+class RangeReportTests(ProductionTestMixin, TestCase):
+    def test_series_load_in_two_queries(self):
+        farm = self.make_farm("range", 4)
+        start = self.today - timedelta(days=29)
+
+        with self.assertNumQueries(2):
+            data = load_range_report_data(farm, start, self.today)
+
+        cow = data.cows[0]
+        self.assertEqual(len(data.days), 30)
+        self.assertEqual(data.series[cow.id][-1], 11.0)
+        self.assertEqual(data.series[cow.id][-2], 11.0)
+        self.assertEqual(data.cow_days(cow.id), 2)
+        self.assertEqual(data.cow_average(cow.id), Decimal("11.00"))
+        self.assertEqual(data.session_total(MilkRecord.MORNING), Decimal("44.00"))
+        self.assertEqual(data.total(), Decimal("88.00"))
+        self.assertTrue(build_report(data).render().getvalue().startswith(b"%PDF"))
+
+    def test_report_period(self):
+        anchor = date(2024, 2, 14)  # a Wednesday
+        self.assertEqual(
+            report_period("week", anchor), (date(2024, 2, 12), date(2024, 2, 18))
+        )
+        self.assertEqual(
+            report_period("month", anchor), (date(2024, 2, 1), date(2024, 2, 29))
+        )
+
+
+class ManagerClientMixin(ProductionTestMixin):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            email="manager@example.com",
+            role=User.MANAGER,
+            account=self.account,
+            full_name="Farm Manager",
+            phone="254711111111",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class MilkBulkRecordTests(ManagerClientMixin, TestCase):
+    def test_bulk_upsert_reports_per_index_errors(self):
+        farm = self.make_farm("bulk", 20)
+        cows = list(farm.cows.order_by("id"))
+        other_account = Account.objects.create(
+            account_type=Account.COMPANY, name="Other", phone="254722222222"
+        )
+        foreign_cow = self.make_farm("foreign", 1, other_account).cows.get()
+
+        rows = [
+            {
+                "cow": cow.id,
+                "date": str(self.today),
+                "session": MilkRecord.AFTERNOON,
+                "quantity_in_liters": "4.00",
+            }
+            for cow in cows
+        ]
+        # Existing record gets updated rather than rejected
+        rows.append({
+            "cow": cows[0].id,
+            "date": str(self.today),
+            "session": MilkRecord.MORNING,
+            "quantity_in_liters": "9.00",
+        })
+        rows.append({
+            "cow": foreign_cow.id,
+            "date": str(self.today),
+            "session": MilkRecord.MORNING,
+            "quantity_in_liters": "1.00",
+        })
+        rows.append({
+            "cow": cows[1].id,
+            "date": str(self.today),
+            "session": MilkRecord.MORNING,
+            "quantity_in_liters": "0",
+        })
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/production/milk-records/bulk/", rows, format="json"
+            )
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(len(response.data["created_records"]), 21)
+        self.assertEqual(
+            [error["index"] for error in response.data["errors"]], [21, 22]
+        )
+        self.assertEqual(
+            MilkRecord.objects.get(
+                cow=cows[0], date=self.today, session=MilkRecord.MORNING
+            ).quantity_in_liters,
+            Decimal("9.00"),
+        )
+        self.assertLess(len(queries), 15)
+
+
+class MilkRecordListTests(ManagerClientMixin, TestCase):
+    def test_keyset_pages_cover_every_record_once(self):
+        farm = self.make_farm("list", 7)
+        self.make_farm(
+            "hidden", 2,
+            Account.objects.create(
+                account_type=Account.COMPANY, name="Other", phone="254733333333"
+            ),
+        )
+
+        seen = []
+        url = "/production/milk-records/?page_size=5"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 5)
+            seen.extend(record["id"] for record in response.data["results"])
+            url = response.data["next"]
+
+        expected = MilkRecord.objects.filter(cow__farm=farm)
+        self.assertEqual(sorted(seen), sorted(expected.values_list("id", flat=True)))
+
+    def test_filters_and_bad_cursor(self):
+        self.make_farm("filters", 3)
+
+        response = self.client.get(
+            "/production/milk-records/",
+            {"date_from": str(self.today), "session": MilkRecord.EVENING},
+        )
+        self.assertEqual(len(response.data["results"]), 3)
+
+        response = self.client.get("/production/milk-records/?cursor=nope")
+        self.assertEqual(response.status_code, 400)
+
+        for url in ("/production/milk-records/", "/production/milk-records/export/"):
+            for param, value in (
+                ("date_from", "2024-02-30"),
+                ("farm", "abc"),
+                ("cow", "-1"),
+                ("session", "NOON"),
+            ):
+                response = self.client.get(url, {param: value})
+                self.assertEqual(response.status_code, 400, (url, param))
+                self.assertEqual(response.data["detail"], f"Invalid {param}")
+
+
+class MilkRecordExportTests(ManagerClientMixin, TestCase):
+    def test_streams_csv_and_ndjson(self):
+        self.make_farm("export", 4)
+
+        response = self.client.get("/production/milk-records/export/")
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[0], "id")
+        self.assertEqual(len(lines), 1 + 16)
+
+        response = self.client.get(
+            "/production/milk-records/export/",
+            {"export_format": "ndjson", "session": MilkRecord.MORNING},
+        )
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 8)
+        self.assertEqual(json.loads(lines[0])["session"], MilkRecord.MORNING)
+
+
+class ReportDownloadTests(ManagerClientMixin, TestCase):
+    url = "/production/reports/milk-production/download/"
+
+    def test_streams_report_without_loose_files(self):
+        farm = self.make_farm("download", 3)
+
+        for enabled in (True, False):
+            with self.settings(REPORT_CACHE_ENABLED=enabled):
+                response = self.client.get(self.url, {"farm": farm.id})
+            self.assertEqual(response.status_code, 200)
+            body = b"".join(response.streaming_content)
+            self.assertTrue(body.startswith(b"%PDF"))
+            self.assertEqual(int(response["Content-Length"]), len(body))
+
+        reports_dir = os.path.join(self.media_root, "reports")
+        self.assertEqual(
+            [name for name in os.listdir(reports_dir) if name != "cache"], []
+        )
+        self.assertEqual(len(os.listdir(os.path.join(reports_dir, "cache"))), 1)
+
+    def test_range_requests(self):
+        farm = self.make_farm("range", 2)
+        full = b"".join(
+            self.client.get(self.url, {"farm": farm.id}).streaming_content
+        )
+
+        for enabled in (True, False):
+            with self.settings(REPORT_CACHE_ENABLED=enabled):
+                response = self.client.get(
+                    self.url, {"farm": farm.id}, HTTP_RANGE="bytes=10-19"
+                )
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(
+                    response["Content-Range"], f"bytes 10-19/{len(full)}"
+                )
+                self.assertEqual(b"".join(response.streaming_content), full[10:20])
+
+                response = self.client.get(
+                    self.url, {"farm": farm.id}, HTTP_RANGE="bytes=-5"
+                )
+                self.assertEqual(b"".join(response.streaming_content), full[-5:])
+
+                response = self.client.get(
+                    self.url, {"farm": farm.id}, HTTP_RANGE=f"bytes={len(full)}-"
+                )
+                self.assertEqual(response.status_code, 416)
+
+    def test_offloaded_backends(self):
+        farm = self.make_farm("offload", 2)
+        cached = get_or_generate_report(farm, self.today)
+
+        with self.settings(REPORT_FILE_BACKEND="nginx"):
+            response = self.client.get(self.url, {"farm": farm.id})
+        self.assertEqual(response.content, b"")
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            f"/protected-reports/cache/{os.path.basename(cached)}",
+        )
+
+        with self.settings(REPORT_FILE_BACKEND="sendfile"):
+            response = self.client.get(self.url, {"farm": farm.id})
+        self.assertEqual(response["X-Sendfile"], os.path.realpath(cached))
+
+    def test_range_reports(self):
+        farm = self.make_farm("ranges", 3)
+        cow = farm.cows.order_by("id").first()
+
+        for params in (
+            {"period": "week"},
+            {"period": "month", "date": str(self.yesterday)},
+            {"start": str(self.yesterday), "end": str(self.today), "cow": cow.id},
+        ):
+            response = self.client.get(self.url, {"farm": farm.id, **params})
+            self.assertEqual(response.status_code, 200, params)
+            self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+
+        for params, code in (
+            ({"period": "year"}, 400),
+            ({"start": str(self.today), "end": str(self.yesterday)}, 400),
+            ({"start": "2024-02-01", "end": "2024-02-30"}, 400),
+            ({"date": "2024-02-30"}, 400),
+            ({"period": "week", "date": "2024-13-01"}, 400),
+            ({"period": "week", "cow": 999999}, 404),
+        ):
+            response = self.client.get(self.url, {"farm": farm.id, **params})
+            self.assertEqual(response.status_code, code, params)
+
+    def test_other_accounts_farms_are_hidden(self):
+        other = Account.objects.create(
+            account_type=Account.INDIVIDUAL, name="Other", phone="254711111111"
+        )
+        farm = self.make_farm("hidden", 1, account=other)
+
+        response = self.client.get(self.url, {"farm": farm.id})
+        self.assertEqual(response.status_code, 404)
+
+    def test_sweep_removes_loose_and_stale_files(self):
+        farm = self.make_farm("sweep", 2)
+        cached = get_or_generate_report(farm, self.today)
+        cache_dir = os.path.dirname(cached)
+
+        loose = os.path.join(self.media_root, "reports", "legacy.pdf")
+        fresh = os.path.join(self.media_root, "reports", "serving.pdf")
+        stale_tmp = os.path.join(cache_dir, ".farm_1.pdf.abc.tmp")
+        fresh_tmp = os.path.join(cache_dir, ".farm_1.pdf.def.tmp")
+        for path in (loose, fresh, stale_tmp, fresh_tmp):
+            open(path, "wb").close()
+        for path in (loose, stale_tmp):
+            os.utime(path, (0, 0))
+
+        self.assertEqual(sweep_reports(), (1, 1, 0))
+        self.assertTrue(os.path.exists(cached))
+        self.assertFalse(os.path.exists(loose))
+        # Possibly still being written or served
+        self.assertTrue(os.path.exists(fresh))
+        self.assertTrue(os.path.exists(fresh_tmp))
+        self.assertEqual(sweep_reports(min_age_minutes=0)[:2], (1, 1))
+
+        self.assertEqual(sweep_reports(max_bytes=0), (0, 0, 1))
+        self.assertFalse(os.path.exists(cached))
+
+
+class WhatsAppReportFlowTests(ManagerClientMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.farm = self.make_farm("whatsapp", 8)
+        self.user.farms.add(self.farm)
+
+        patcher = mock.patch("production.utils.outbound.get_sender")
+        self.whatsapp = patcher.start().return_value
+        self.whatsapp.upload_pdf.return_value = "media-1"
+        self.whatsapp.phone_number_id = "sender-1"
+        for send in (self.whatsapp.send_text, self.whatsapp.send_document):
+            send.return_value.json.return_value = {
+                "messages": [{"id": "wamid.1"}]
+            }
+        self.addCleanup(patcher.stop)
+
+        # The outbox is drained explicitly instead of by the background thread
+        patcher = mock.patch("production.utils.outbound.dispatch_outbound")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Wait for background cache warming before asserting on it
+        self.prewarms = []
+        patcher = mock.patch(
+            "production.views.prewarm_report",
+            side_effect=lambda *args, **kwargs: self.prewarms.append(
+                prewarm_report(*args, **kwargs)
+            ),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.view = ProductionCallBack()
+
+    def route(self, text):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.view.route_message(self.user.phone, text)
+        for future in self.prewarms:
+            future.result(timeout=60)
+        return deliver_pending(workers=1)
+
+    def last_text(self):
+        return self.whatsapp.send_text.call_args.args[1]
+
+    def test_summary_is_text_only_and_pdf_is_explicit(self):
+        self.route("hi")
+        self.assertIn("3️⃣", self.last_text())
+
+        self.route("2")
+        summary = self.last_text()
+        self.assertIn("Total: *88.00 L*", summary)
+        self.assertIn("Top cows", summary)
+        self.assertIn("Lowest cows", summary)
+        self.assertLess(len(summary.encode()), 1024)
+        self.whatsapp.upload_pdf.assert_not_called()
+
+        # The PDF was rendered into the cache in the background
+        cache_dir = os.path.join(self.media_root, "reports", "cache")
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+        self.route("3")
+        self.whatsapp.upload_pdf.assert_called_once()
+        self.whatsapp.send_document.assert_called_once_with(
+            self.user.phone, "media-1", mock.ANY
+        )
+
+    def test_failed_prewarm_is_logged_not_retried(self):
+        self.route("hi")
+        with mock.patch(
+            "production.utils.report_cache.render_report",
+            side_effect=OSError("disk full"),
+        ), self.assertLogs("production.utils.report_cache", "ERROR"):
+            self.route("2")
+
+        # The summary went out once and the PDF is rendered on demand later
+        self.assertEqual(self.whatsapp.send_text.call_count, 2)
+        self.assertIn("Top cows", self.last_text())
+        self.assertFalse(
+            os.listdir(os.path.join(self.media_root, "reports", "cache"))
+        )
+
+    def test_identical_reports_are_uploaded_once(self):
+        for _ in range(2):
+            self.route("hi")
+            self.route("3")
+
+        self.whatsapp.upload_pdf.assert_called_once()
+        self.assertEqual(self.whatsapp.send_document.call_count, 2)
+        media = WhatsAppMedia.objects.get()
+        self.assertEqual(media.media_id, "media-1")
+
+        # Expired media ids are not reused
+        WhatsAppMedia.objects.update(expires_at=timezone.now())
+        self.whatsapp.upload_pdf.return_value = "media-2"
+        self.route("hi")
+        self.route("3")
+        self.assertEqual(self.whatsapp.upload_pdf.call_count, 2)
+        self.assertEqual(WhatsAppMedia.objects.get().media_id, "media-2")
+
+        # Different content gets its own upload
+        self.whatsapp.upload_pdf.return_value = "media-3"
+        self.assertEqual(get_or_upload_media(b"%PDF", client=self.whatsapp), "media-3")
+        self.assertEqual(WhatsAppMedia.objects.count(), 2)
+
+    def test_outbox_commits_with_the_state_change(self):
+        def reply_then_fail(session, user, text):
+            self.view.send(user.phone, "never sent")
+            raise RuntimeError("handler failed")
+
+        # A failing handler takes its replies down with it
+        with mock.patch.object(
+            self.view, "handle_start", side_effect=reply_then_fail
+        ), self.assertRaises(RuntimeError):
+            self.view.route_message(self.user.phone, "hi")
+        self.assertFalse(OutboundMessage.objects.exists())
+
+        # Queued, not sent, until a worker drains the outbox
+        self.view.route_message(self.user.phone, "hi")
+        message = OutboundMessage.objects.get()
+        self.assertEqual(message.status, OutboundMessage.PENDING)
+        self.whatsapp.send_text.assert_not_called()
+
+    def test_outbox_retries_in_order_and_dead_letters(self):
+        first = enqueue_text(self.user.phone, "first")
+        second = enqueue_text(self.user.phone, "second")
+        other = enqueue_text("254700000001", "other phone")
+
+        # A failing message holds back later ones to the same phone only
+        self.whatsapp.send_text.side_effect = [
+            requests.ConnectionError("down"),
+            mock.DEFAULT,
+        ]
+        counts = deliver_pending(workers=1)
+        self.assertEqual(counts, {"sent": 1, "retried": 1, "dead": 0})
+        first.refresh_from_db()
+        self.assertEqual(first.status, OutboundMessage.PENDING)
+        self.assertGreater(first.next_attempt_at, timezone.now())
+        self.assertEqual(
+            OutboundMessage.objects.get(pk=second.pk).status,
+            OutboundMessage.PENDING,
+        )
+        other.refresh_from_db()
+        self.assertEqual(other.status, OutboundMessage.SENT)
+        self.assertEqual(other.wa_message_id, "wamid.1")
+
+        # Permanent API errors are dead-lettered; the queue moves on
+        error = requests.HTTPError(response=mock.Mock(status_code=400))
+        self.whatsapp.send_text.side_effect = [error, mock.DEFAULT]
+        OutboundMessage.objects.filter(pk=first.pk).update(
+            next_attempt_at=timezone.now()
+        )
+        counts = deliver_pending(workers=1)
+        self.assertEqual(counts, {"sent": 1, "retried": 0, "dead": 1})
+        first.refresh_from_db()
+        self.assertEqual(first.status, OutboundMessage.DEAD)
+        self.assertEqual(first.attempts, 2)
+        self.assertEqual(self.last_text(), "second")
+
+    def test_outbox_retries_transient_errors(self):
+        for error in (
+            requests.JSONDecodeError("Expecting value", "<html>", 0),
+            requests.HTTPError(response=mock.Mock(status_code=502)),
+            requests.HTTPError(response=mock.Mock(status_code=429)),
+        ):
+            message = enqueue_text(self.user.phone, "flaky")
+            self.whatsapp.send_text.side_effect = [error]
+            counts = deliver_pending(workers=1)
+            self.assertEqual(counts, {"sent": 0, "retried": 1, "dead": 0}, error)
+            message.refresh_from_db()
+            self.assertEqual(message.status, OutboundMessage.PENDING)
+            message.delete()
+
+        message = enqueue_text(self.user.phone, "unknown")
+        OutboundMessage.objects.filter(pk=message.pk).update(kind="fax")
+        counts = deliver_pending(workers=1)
+        self.assertEqual(counts, {"sent": 0, "retried": 0, "dead": 1})
+
+    def test_confirming_a_session_twice_upserts(self):
+        cows = list(self.farm.cows.order_by("id"))
+
+        for quantity in ("7", "9.25"):
+            for text in ("hi", "1", "1", ",".join([quantity] * len(cows)), "1"):
+                self.route(text)
+            self.assertEqual(self.last_text(), "✅ Milk production saved.")
+
+        records = MilkRecord.objects.filter(
+            cow__farm=self.farm, date=self.today, session=MilkRecord.MORNING
+        )
+        self.assertEqual(records.count(), len(cows))
+        self.assertEqual(
+            set(records.values_list("quantity_in_liters", flat=True)),
+            {Decimal("9.25")},
+        )
+        self.assertEqual(
+            set(records.values_list("recorded_by", flat=True)), {self.user.id}
+        )
+
+        # Rollups follow the second confirmation, not the sum of both
+        daily = CowDailyMilk.objects.get(cow=cows[0], date=self.today)
+        self.assertEqual(daily.morning, Decimal("9.25"))
+        self.assertEqual(daily.total, Decimal("14.75"))
+
+    @override_settings(WHATSAPP_SENDER_IDS=["sender-a", "sender-b", "sender-c"])
+    def test_recipients_stick_to_one_sender(self):
+        recipients = [f"2547000{i:05d}" for i in range(300)]
+        owners = {phone: get_sender(phone) for phone in recipients}
+
+        # Selection depends only on the phone, not on call order or on
+        # which client objects happen to be cached
+        for phone in reversed(recipients):
+            self.assertIs(get_sender(phone), owners[phone])
+        with mock.patch.dict("production.utils.whatsapp._clients", clear=True):
+            for phone in recipients:
+                self.assertEqual(
+                    get_sender(phone).phone_number_id,
+                    owners[phone].phone_number_id,
+                )
+
+        load = Counter(client.phone_number_id for client in owners.values())
+        self.assertEqual(set(load), {"sender-a", "sender-b", "sender-c"})
+        self.assertGreater(min(load.values()), 50)
+
+        # Each sender throttles itself
+        self.assertIsNot(
+            get_client("sender-a").bucket, get_client("sender-b").bucket
+        )
+
+        # Dropping a sender only moves the recipients it owned
+        with override_settings(WHATSAPP_SENDER_IDS=["sender-a", "sender-b"]):
+            for phone, client in owners.items():
+                if client.phone_number_id != "sender-c":
+                    self.assertIs(get_sender(phone), client)
+
+    def test_summary_formats_from_loaded_data(self):
+        data = load_daily_report_data(self.farm, self.today)
+        with self.assertNumQueries(0):
+            text = format_daily_summary(data, top=2)
+
+        self.assertIn("(▶ 0.0% vs yesterday)", text)
+        self.assertIn("🌅 Morning: 44.00 L", text)
+        self.assertIn("☀️ Afternoon: 0.00 L", text)
+        self.assertEqual(text.count(" 11.00 L (+0.00)"), 4)
+
+
+class InboundPipelineTests(ProductionTestMixin, TestCase):
+    phone = "254711000000"
+
+    def queue(self, *texts):
+        return [
+            InboundMessage.objects.create(phone=self.phone, text=text)
+            for text in texts
+        ]
+
+    def test_lane_keeps_order_and_retries_failures_in_place(self):
+        first, second, third = self.queue("first", "second", "third")
+        handled = []
+        failures = iter([RuntimeError("deadlock")])
+
+        def route(view, phone, text):
+            handled.append(text)
+            if text == "first":
+                error = next(failures, None)
+                if error:
+                    raise error
+
+        with mock.patch.object(ProductionCallBack, "route_message", route):
+            self.assertEqual(process_pending_for_phone(self.phone), 3)
+
+        self.assertEqual(handled, ["first", "first", "second", "third"])
+        first.refresh_from_db()
+        self.assertEqual(first.status, InboundMessage.DONE)
+        self.assertEqual(first.attempts, 2)
+
+    @override_settings(WEBHOOK_MAX_ATTEMPTS=2)
+    def test_retries_are_bounded(self):
+        broken, after = self.queue("broken", "after")
+        handled = []
+
+        def route(view, phone, text):
+            handled.append(text)
+            if text == "broken":
+                raise RuntimeError("bad input")
+
+        with mock.patch.object(
+            ProductionCallBack, "route_message", route
+        ), self.assertLogs("production.utils.inbound", "WARNING") as logs:
+            process_pending_for_phone(self.phone)
+
+        self.assertEqual(handled, ["broken", "broken", "after"])
+        self.assertEqual(len(logs.output), 1)
+        broken.refresh_from_db()
+        self.assertEqual(broken.status, InboundMessage.FAILED)
+        self.assertEqual(broken.attempts, 2)
+        self.assertIn("bad input", broken.error)
+        after.refresh_from_db()
+        self.assertEqual(after.status, InboundMessage.DONE)
+
+    def test_busy_lane_is_logged_and_left_pending(self):
+        message, = self.queue("hi")
+        with mock.patch(
+            "production.utils.inbound.process_pending_for_phone",
+            side_effect=SingleFlightTimeout(self.phone),
+        ), mock.patch(
+            "production.utils.inbound.connection"
+        ), self.assertLogs("production.utils.inbound", "WARNING") as logs:
+            inbound_worker(self.phone)
+
+        self.assertIn(self.phone, logs.output[0])
+        message.refresh_from_db()
+        self.assertEqual(message.status, InboundMessage.PENDING)
+
+
+@override_settings(
+    WHATSAPP_MAX_RETRIES=2,
+    WHATSAPP_CIRCUIT_FAILURES=3,
+    WHATSAPP_CIRCUIT_RESET_SECONDS=30,
+)
+class WhatsAppClientTests(TestCase):
+    def setUp(self):
+        self.client = WhatsAppClient("sender-1", "token")
+        self.client.session = mock.Mock()
+        self.post = self.client.session.post
+
+        patcher = mock.patch("production.utils.whatsapp.time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def response(self, status_code):
+        response = mock.Mock(status_code=status_code, headers={})
+        if status_code >= 400:
+            response.raise_for_status.side_effect = requests.HTTPError(
+                response=response
+            )
+        return response
+
+    def test_transient_failures_are_retried_with_backoff(self):
+        self.post.side_effect = [
+            self.response(503),
+            requests.ReadTimeout("slow"),
+            self.response(200),
+        ]
+        self.client.send_text("254700000000", "hi")
+        self.assertEqual(self.post.call_count, 3)
+        self.assertEqual(self.sleep.call_count, 2)
+        self.assertEqual(self.client.breaker.failures, 0)
+
+    def test_retries_are_bounded(self):
+        self.post.side_effect = requests.ReadTimeout("slow")
+        with self.assertRaises(requests.ReadTimeout):
+            self.client.send_text("254700000000", "hi")
+        self.assertEqual(self.post.call_count, 3)
+
+        # Client errors are not retried
+        self.post.reset_mock(side_effect=True)
+        self.post.return_value = self.response(400)
+        self.client.breaker.record_success()
+        with self.assertRaises(requests.HTTPError):
+            self.client.send_text("254700000000", "hi")
+        self.assertEqual(self.post.call_count, 1)
+
+    def test_breaker_trips_and_recovers(self):
+        self.post.side_effect = requests.ConnectionError("down")
+        with self.assertRaises(requests.ConnectionError):
+            self.client.send_text("254700000000", "hi")
+        self.assertEqual(self.post.call_count, 3)
+
+        # Open: fails fast without touching the network
+        with self.assertRaises(CircuitOpenError):
+            self.client.send_text("254700000000", "hi")
+        self.assertEqual(self.post.call_count, 3)
+
+        # Half-open after the reset timeout: one probe closes it again
+        self.client.breaker.opened_at -= 30
+        self.post.side_effect = None
+        self.post.return_value = self.response(200)
+        self.client.send_text("254700000000", "hi")
+        self.assertEqual(self.post.call_count, 4)
+        self.assertIsNone(self.client.breaker.opened_at)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class DailyReportThrottleTests(TestCase):
+    def test_token_bucket_paces_calls(self):
+        clock = FakeClock()
+        with mock.patch("production.utils.ratelimit.time", clock):
+            bucket = TokenBucket(rate=10, capacity=2)
+
+            # The burst goes out at once, then one call every 1/rate seconds
+            for _ in range(5):
+                bucket.acquire()
+            self.assertAlmostEqual(clock.now, 0.3)
+            self.assertFalse(bucket.try_acquire())
+
+            clock.now += 0.1
+            self.assertTrue(bucket.try_acquire())
+
+    def test_token_bucket_rejects_unusable_limits(self):
+        for rate, capacity in ((0, None), (-1, None), (10, 0.5)):
+            with self.assertRaises(ValueError):
+                TokenBucket(rate, capacity)
+        self.assertEqual(TokenBucket(0.5).capacity, 1)
+
+    @override_settings(
+        WHATSAPP_MESSAGES_PER_SECOND=20, WHATSAPP_SENDING_PROCESSES=4
+    )
+    def test_tier_limit_is_split_across_processes(self):
+        self.assertEqual(WhatsAppClient("sender-1", "token").bucket.rate, 5)
+
+    def test_rate_must_be_positive(self):
+        for args in (["--rate", "0"], ["--rate", "-1"], ["--burst", "0"]):
+            with self.assertRaises(CommandError):
+                call_command("send_daily_milk_reports", *args, stdout=StringIO())
+
+
+class DailyReportLedgerTests(ProductionTestMixin, TransactionTestCase):
+    # Sends run on worker threads with their own connections
+    def setUp(self):
+        super().setUp()
+        self.farm = self.make_farm("ledger", 3)
+
+        patcher = mock.patch(
+            "production.management.commands.send_daily_milk_reports.get_sender"
+        )
+        self.whatsapp = patcher.start().return_value
+        self.whatsapp.phone_number_id = "sender-1"
+        self.whatsapp.upload_pdf.return_value = "media-1"
+        self.addCleanup(patcher.stop)
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command(
+            "send_daily_milk_reports",
+            "--date", str(self.today),
+            *args,
+            stdout=out,
+            stderr=StringIO(),
+        )
+        return out.getvalue()
+
+    def delivery(self):
+        return ReportDelivery.objects.get(farm=self.farm, date=self.today)
+
+    def test_sends_once_and_skips_sent_rows(self):
+        self.run_command()
+        delivery = self.delivery()
+        self.assertEqual(delivery.stage, ReportDelivery.SENT)
+        self.assertEqual(delivery.media_id, "media-1")
+        self.whatsapp.send_document.assert_called_once_with(
+            self.account.phone, "media-1", mock.ANY
+        )
+
+        output = self.run_command()
+        self.assertIn("1 report(s) already delivered", output)
+        self.assertEqual(self.whatsapp.send_document.call_count, 1)
+
+    def test_resumes_from_the_recorded_stage(self):
+        self.run_command()
+        self.whatsapp.reset_mock()
+
+        # Uploaded before a crash: reuse the stored media id
+        ReportDelivery.objects.filter(pk=self.delivery().pk).update(
+            stage=ReportDelivery.UPLOADED, media_id="media-stored"
+        )
+        self.run_command()
+        self.whatsapp.upload_pdf.assert_not_called()
+        self.whatsapp.send_text.assert_called_once()
+        self.whatsapp.send_document.assert_called_once_with(
+            self.account.phone, "media-stored", mock.ANY
+        )
+
+        # Rendered before a crash: reuse the file on disk
+        self.whatsapp.reset_mock()
+        rendered_at = self.delivery().rendered_at
+        ReportDelivery.objects.filter(pk=self.delivery().pk).update(
+            stage=ReportDelivery.RENDERED, media_id=""
+        )
+        self.run_command()
+        delivery = self.delivery()
+        self.assertEqual(delivery.stage, ReportDelivery.SENT)
+        self.assertEqual(delivery.rendered_at, rendered_at)
+        self.whatsapp.send_document.assert_called_once()
+
+    def test_force_resends_and_failures_are_capped(self):
+        self.whatsapp.send_document.side_effect = requests.ConnectionError("down")
+        for _ in range(3):
+            self.run_command("--max-attempts", "2")
+        delivery = self.delivery()
+        self.assertEqual(delivery.stage, ReportDelivery.NOTIFIED)
+        self.assertEqual(delivery.attempts, 2)
+        self.assertEqual(self.whatsapp.send_document.call_count, 2)
+        self.assertIn("ConnectionError", delivery.last_error)
+
+        self.whatsapp.send_document.side_effect = None
+        output = self.run_command("--max-attempts", "2")
+        self.assertIn("1 report(s) skipped after 2 failed attempts", output)
+
+        # --force starts over, even for exhausted rows
+        self.run_command("--force", "--max-attempts", "2")
+        delivery = self.delivery()
+        self.assertEqual(delivery.stage, ReportDelivery.SENT)
+        self.assertEqual(delivery.attempts, 0)
+        self.assertEqual(self.whatsapp.send_document.call_count, 3)
+
+    def test_uploaded_reports_are_not_rendered_again(self):
+        self.run_command()
+        self.whatsapp.reset_mock()
+
+        # Notified before a crash, and the render was swept since
+        delivery = self.delivery()
+        os.remove(delivery.pdf_path)
+        ReportDelivery.objects.filter(pk=delivery.pk).update(
+            stage=ReportDelivery.NOTIFIED, media_id="media-stored"
+        )
+        self.run_command()
+        self.whatsapp.upload_pdf.assert_not_called()
+        self.whatsapp.send_text.assert_not_called()
+        self.whatsapp.send_document.assert_called_once_with(
+            self.account.phone, "media-stored", mock.ANY
+        )
+        self.assertFalse(os.path.exists(delivery.pdf_path))
+
+        # The ledger never moves backwards
+        delivery = self.delivery()
+        delivery.advance(ReportDelivery.RENDERED, pdf_path="/tmp/late.pdf")
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.stage, ReportDelivery.SENT)
+        self.assertEqual(delivery.pdf_path, "/tmp/late.pdf")
+
+    def claimer(self, worker_id):
+        node = SendDailyReports(stdout=StringIO(), stderr=StringIO())
+        node.worker_id = worker_id
+        node.options = {
+            "accounts": None,
+            "claim": True,
+            "batch_size": 10,
+            "lease_seconds": 600,
+            "max_attempts": 5,
+        }
+        return node
+
+    def test_expired_lease_is_delivered_by_one_node(self):
+        node_a, node_b = self.claimer("node-a"), self.claimer("node-b")
+        node_a.seed_ledger(self.today)
+
+        claimed, = node_a.claim_batch(self.today, set())
+        self.assertEqual(node_b.claim_batch(self.today, set()), [])
+
+        # Node A stalls past its lease and node B takes the delivery over
+        ReportDelivery.objects.update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        taken_over, = node_b.claim_batch(self.today, set())
+        self.assertEqual(taken_over.pk, claimed.pk)
+
+        pdf_path = os.path.join(self.media_root, "report.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(b"%PDF-1.4")
+
+        with self.assertRaises(LeaseLost):
+            node_a.send_farm_report(claimed, pdf_path)
+        self.whatsapp.upload_pdf.assert_not_called()
+        self.whatsapp.send_text.assert_not_called()
+        self.whatsapp.send_document.assert_not_called()
+
+        node_b.send_farm_report(taken_over, pdf_path)
+        self.whatsapp.send_document.assert_called_once()
+        delivery = self.delivery()
+        self.assertEqual(delivery.stage, ReportDelivery.SENT)
+        self.assertEqual(delivery.lease_owner, "node-b")
+
+
+class ReportSchedulerTests(ProductionTestMixin, TestCase):
+    # 12:00 UTC: 13:00 in London, 15:00 in Nairobi
+    now = datetime(2024, 6, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        self.london = self.make_account("London", "Europe/London")
+        self.nairobi = self.make_account("Nairobi", "Africa/Nairobi")
+        for account in (self.london, self.nairobi):
+            self.make_farm(account.name, 1, account=account)
+
+        patcher = mock.patch(
+            "production.management.commands.run_report_scheduler.timezone.now",
+            return_value=self.now,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_account(self, name, tz):
+        return Account.objects.create(
+            account_type=Account.INDIVIDUAL,
+            name=name,
+            phone=f"2547{len(name):08d}",
+            report_delivery_time=dt_time(6, 0),
+            report_timezone=tz,
+        )
+
+    def run_slot(self, **options):
+        options = {
+            "slot_capacity": 50,
+            "max_attempts": 3,
+            "render_workers": 1,
+            "send_workers": 1,
+            "rate": 20,
+            **options,
+        }
+        with mock.patch(
+            "production.management.commands.run_report_scheduler.call_command"
+        ) as send:
+            ReportScheduler(stdout=StringIO()).run_slot(options)
+        return send
+
+    def test_most_overdue_first_across_time_zones(self):
+        # Both are due at 06:00 local, but Nairobi's 06:00 came 2 hours earlier
+        send = self.run_slot()
+        send.assert_called_once()
+        self.assertEqual(
+            send.call_args.kwargs["accounts"], [self.nairobi.id, self.london.id]
+        )
+        self.assertEqual(send.call_args.kwargs["date"], "2024-06-01")
+        self.assertEqual(send.call_args.kwargs["max_attempts"], 3)
+
+    def test_slot_budget_defers_the_rest(self):
+        send = self.run_slot(slot_capacity=1)
+        self.assertEqual(send.call_args.kwargs["accounts"], [self.nairobi.id])
+
+        # Deliveries out of attempts count as finished and are not retried
+        ReportDelivery.objects.create(
+            farm=self.nairobi.farms.get(),
+            date=date(2024, 6, 1),
+            recipient=self.nairobi.phone,
+            attempts=2,
+        )
+        send = self.run_slot(slot_capacity=1, max_attempts=2)
+        self.assertEqual(send.call_args.kwargs["accounts"], [self.london.id])
+        self.assertEqual(send.call_args.kwargs["max_attempts"], 2)
+
+
+class MilkRollupTests(ManagerClientMixin, TestCase):
+    def farm_total(self, farm, session):
+        return FarmDailyMilk.objects.get(
+            farm=farm, date=self.today, session=session
+        ).total
+
+    def test_rollups_follow_every_write_path(self):
+        farm = self.make_farm("rollup", 3)
+        cows = list(farm.cows.order_by("id"))
+        self.assertEqual(self.farm_total(farm, MilkRecord.MORNING), Decimal("16.50"))
+
+        # Single record
+        record = MilkRecord.objects.get(
+            cow=cows[0], date=self.today, session=MilkRecord.MORNING
+        )
+        record.quantity_in_liters = Decimal("10.00")
+        record.save()
+        self.assertEqual(self.farm_total(farm, MilkRecord.MORNING), Decimal("21.00"))
+
+        # Bulk upload
+        self.client.post(
+            "/production/milk-records/bulk/",
+            [
+                {
+                    "cow": cow.id,
+                    "date": str(self.today),
+                    "session": MilkRecord.AFTERNOON,
+                    "quantity_in_liters": "2.00",
+                }
+                for cow in cows
+            ],
+            format="json",
+        )
+        self.assertEqual(self.farm_total(farm, MilkRecord.AFTERNOON), Decimal("6.00"))
+        daily = CowDailyMilk.objects.get(cow=cows[0], date=self.today)
+        self.assertEqual(daily.total, Decimal("17.50"))
+
+        # Delete
+        record.delete()
+        self.assertEqual(self.farm_total(farm, MilkRecord.MORNING), Decimal("11.00"))
+        self.assertEqual(
+            FarmDailyMilk.objects.get(
+                farm=farm, date=self.today, session=MilkRecord.MORNING
+            ).record_count,
+            2,
+        )
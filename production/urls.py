@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import (
     MilkRecordAPIView,
+    MilkRecordExportAPIView,
     ProductionCallBack,
     MilkBulkRecordAPIView,
     MilkProductionReportDownloadAPIView
@@ -9,6 +10,8 @@ from .views import (
 urlpatterns = [
     path("milk-records/", MilkRecordAPIView.as_view(),
          name="milk-record-list-create"),
+    path("milk-records/export/", MilkRecordExportAPIView.as_view(),
+         name="milk-record-export"),
     path("milk-records/<uuid:pk>/", MilkRecordAPIView.as_view(),
          name="milk-record-update"),
     path("milk-records/callback-url", ProductionCallBack.as_view(),
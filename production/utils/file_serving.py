@@ -0,0 +1,136 @@
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+from production.utils.report_cache import report_cache_dir
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Parse a single ``bytes=`` range into inclusive ``(start, end)``.
+
+    Returns None when the header should be ignored (missing, malformed or
+    multi-range, which we answer with the whole file) and raises
+    ``RangeNotSatisfiable`` when the range lies outside the file.
+    """
+    match = RANGE_RE.match((header or "").strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size:
+            raise RangeNotSatisfiable
+        if end < start:
+            return None
+    else:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if not length:
+            raise RangeNotSatisfiable
+        start, end = max(0, size - length), size - 1
+    return start, end
+
+
+def _read_range(fileobj, start, length):
+    try:
+        fileobj.seek(start)
+        while length > 0:
+            chunk = fileobj.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+def stream_file(request, fileobj, size, filename, content_type="application/pdf"):
+    """
+    Stream a seekable binary file from Django, honouring a single HTTP
+    Range request with a 206 partial response.
+    """
+    try:
+        byte_range = parse_range(request.headers.get("Range"), size)
+    except RangeNotSatisfiable:
+        fileobj.close()
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        response = FileResponse(
+            fileobj,
+            as_attachment=True,
+            filename=filename,
+            content_type=content_type,
+        )
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(fileobj, start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = end - start + 1
+        response["Content-Disposition"] = content_disposition_header(
+            True, filename
+        )
+
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def serve_report_file(request, path, filename):
+    """
+    Serve a report file from ``MEDIA_ROOT/reports`` with the backend named
+    by ``REPORT_FILE_BACKEND``:
+
+    * ``django``: stream from this process (with Range support)
+    * ``nginx``: hand off via ``X-Accel-Redirect`` to the internal location
+      ``REPORT_ACCEL_REDIRECT_PREFIX`` aliased to ``MEDIA_ROOT/reports``
+    * ``sendfile``: hand off via ``X-Sendfile`` (Apache, lighttpd, Caddy)
+
+    The offloading backends return an empty response straight away, so the
+    front-end server sends the bytes without holding a Python worker.
+    """
+    backend = settings.REPORT_FILE_BACKEND
+    path = Path(path).resolve()
+
+    if backend == "django":
+        return stream_file(
+            request, open(path, "rb"), os.path.getsize(path), filename
+        )
+
+    response = HttpResponse(content_type="application/pdf")
+    response["Content-Disposition"] = content_disposition_header(True, filename)
+
+    if backend == "nginx":
+        relative = path.relative_to(report_cache_dir().parent)
+        prefix = settings.REPORT_ACCEL_REDIRECT_PREFIX.rstrip("/")
+        response["X-Accel-Redirect"] = f"{prefix}/{relative.as_posix()}"
+    elif backend == "sendfile":
+        response["X-Sendfile"] = str(path)
+    else:
+        raise ImproperlyConfigured(
+            f"Unknown REPORT_FILE_BACKEND {backend!r}; "
+            "expected 'django', 'nginx' or 'sendfile'"
+        )
+
+    return response
@@ -0,0 +1,143 @@
+import logging
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from production.models import InboundMessage
+from production.utils.singleflight import SingleFlightTimeout, single_flight
+
+
+logger = logging.getLogger(__name__)
+
+# One single-threaded lane per slot so a phone's messages keep their order
+_lanes = None
+
+
+def _get_lanes():
+    global _lanes
+    if _lanes is None:
+        _lanes = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"inbound-{i}")
+            for i in range(max(1, settings.WEBHOOK_WORKERS))
+        ]
+    return _lanes
+
+
+def record_inbound(message):
+    """
+    Persist a WhatsApp text message from the webhook payload.
+
+    Returns None when the message was already stored (a Meta retry).
+    """
+    wa_message_id = message.get("id") or None
+    defaults = {
+        "phone": message["from"],
+        "text": message["text"]["body"].strip(),
+    }
+
+    if wa_message_id is None:
+        return InboundMessage.objects.create(**defaults)
+
+    inbound, created = InboundMessage.objects.get_or_create(
+        wa_message_id=wa_message_id, defaults=defaults
+    )
+    return inbound if created else None
+
+
+def dispatch_inbound(phone):
+    """
+    Queue processing of a phone's pending messages on the worker pool.
+    """
+    lanes = _get_lanes()
+    lane = lanes[zlib.crc32(phone.encode()) % len(lanes)]
+    lane.submit(_run_in_worker, phone)
+
+
+def _run_in_worker(phone):
+    try:
+        process_pending_for_phone(phone)
+    except SingleFlightTimeout:
+        # Another lane or process still holds this phone; its messages stay
+        # pending for that holder or process_inbound_messages
+        logger.warning("Inbound lock for %s busy, messages left pending", phone)
+    except Exception:
+        logger.exception("Processing inbound messages for %s failed", phone)
+    finally:
+        # Worker threads own their connections; don't leak them
+        connection.close()
+
+
+def process_pending_for_phone(phone):
+    """
+    Route a phone's pending messages, oldest first.
+
+    Holds a per-phone lock so messages from one conversation are never
+    handled concurrently, even across processes. A failing message is
+    retried in place, ahead of the phone's later messages, until it has
+    used ``WEBHOOK_MAX_ATTEMPTS``; then it is marked failed. Returns the
+    number of messages processed.
+    """
+    from production.views import ProductionCallBack
+
+    processed = 0
+    with single_flight(f"inbound:{phone}", timeout=60):
+        while True:
+            with transaction.atomic():
+                inbound = (
+                    InboundMessage.objects
+                    .select_for_update(skip_locked=True)
+                    .filter(phone=phone, status=InboundMessage.PENDING)
+                    .order_by("created_at", "id")
+                    .first()
+                )
+                if inbound is None:
+                    return processed
+
+                InboundMessage.objects.filter(pk=inbound.pk).update(
+                    status=InboundMessage.PROCESSING,
+                    attempts=F("attempts") + 1,
+                    started_at=timezone.now(),
+                )
+
+            try:
+                ProductionCallBack().route_message(inbound.phone, inbound.text)
+                inbound.status = InboundMessage.DONE
+                inbound.error = ""
+            except Exception as e:
+                # route_message is atomic, so a retry starts from scratch
+                inbound.error = repr(e)
+                if inbound.attempts + 1 < settings.WEBHOOK_MAX_ATTEMPTS:
+                    inbound.status = InboundMessage.PENDING
+                    inbound.save(update_fields=["status", "error"])
+                    continue
+                inbound.status = InboundMessage.FAILED
+                logger.warning(
+                    "Inbound message %s for %s failed: %r", inbound.pk, phone, e
+                )
+
+            inbound.processed_at = timezone.now()
+            inbound.save(update_fields=["status", "error", "processed_at"])
+            processed += 1
+
+
+def requeue_stale(minutes=None):
+    """
+    Return messages stuck in processing (e.g. after a worker crash) to the
+    pending queue.
+    """
+    if minutes is None:
+        minutes = settings.WEBHOOK_STALE_AFTER_MINUTES
+
+    return (
+        InboundMessage.objects
+        .filter(
+            status=InboundMessage.PROCESSING,
+            started_at__lt=timezone.now() - timedelta(minutes=minutes),
+        )
+        .update(status=InboundMessage.PENDING)
+    )
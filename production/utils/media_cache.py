@@ -0,0 +1,92 @@
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from production.models import WhatsAppMedia
+from production.utils.singleflight import single_flight
+from production.utils.whatsapp import get_client
+
+
+# Stop reusing a media id this long before the Graph API drops it, so a
+# send queued just before expiry still finds the document
+EXPIRY_MARGIN = timedelta(days=1)
+
+
+def _read_pdf(pdf):
+    if isinstance(pdf, (bytes, bytearray)):
+        return bytes(pdf)
+    if hasattr(pdf, "read"):
+        pdf.seek(0)
+        return pdf.read()
+    with open(pdf, "rb") as f:
+        return f.read()
+
+
+def _cached_media_id(phone_number_id, content_hash):
+    return (
+        WhatsAppMedia.objects
+        .filter(
+            phone_number_id=phone_number_id,
+            content_hash=content_hash,
+            expires_at__gt=timezone.now() + EXPIRY_MARGIN,
+        )
+        .values_list("media_id", flat=True)
+        .first()
+    )
+
+
+def get_or_upload_media(pdf, filename=None, client=None):
+    """
+    Return a media id for ``pdf`` (a path, bytes or seekable file),
+    uploading it only if this sender has no live upload of the same
+    content yet.
+
+    Recipients of the same report share one upload per sender number.
+    """
+    client = client or get_client()
+    if isinstance(pdf, (str, os.PathLike)):
+        filename = filename or os.path.basename(pdf)
+
+    content = _read_pdf(pdf)
+    content_hash = hashlib.sha256(content).hexdigest()
+    phone_number_id = client.phone_number_id
+
+    media_id = _cached_media_id(phone_number_id, content_hash)
+    if media_id:
+        return media_id
+
+    # Concurrent senders of the same report wait for one upload
+    with single_flight(f"whatsapp-media:{phone_number_id}:{content_hash}"):
+        media_id = _cached_media_id(phone_number_id, content_hash)
+        if media_id:
+            return media_id
+
+        media_id = client.upload_pdf(content, filename)
+
+        now = timezone.now()
+        WhatsAppMedia.objects.update_or_create(
+            phone_number_id=phone_number_id,
+            content_hash=content_hash,
+            defaults={
+                "media_id": media_id,
+                "size": len(content),
+                "uploaded_at": now,
+                "expires_at": now + timedelta(
+                    days=settings.WHATSAPP_MEDIA_TTL_DAYS
+                ),
+            },
+        )
+    return media_id
+
+
+def purge_expired_media():
+    """
+    Delete media cache rows the Graph API no longer honours.
+    """
+    deleted, _ = WhatsAppMedia.objects.filter(
+        expires_at__lte=timezone.now() + EXPIRY_MARGIN
+    ).delete()
+    return deleted
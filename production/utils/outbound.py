@@ -0,0 +1,276 @@
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from accounts.models import Farm
+from production.models import OutboundMessage
+from production.utils.media_cache import get_or_upload_media
+from production.utils.report_cache import open_report
+from production.utils.whatsapp import get_sender
+
+
+class UnknownMessageKind(Exception):
+    pass
+
+
+# ==================================================
+# Enqueueing
+# ==================================================
+def enqueue_text(phone, text):
+    """
+    Queue a text message. Call inside the transaction that changes the
+    state the message announces; it is delivered once that commits.
+    """
+    return _enqueue(phone, OutboundMessage.TEXT, {"text": text})
+
+
+def enqueue_report(phone, farm, report_date, caption, profile=None):
+    """
+    Queue a farm's daily report PDF. Rendering and upload happen on
+    delivery, through the report and media caches.
+    """
+    return _enqueue(phone, OutboundMessage.REPORT, {
+        "farm_id": farm.id,
+        "date": report_date.isoformat(),
+        "profile": profile or settings.WHATSAPP_REPORT_PROFILE,
+        "filename": f"milk_report_farm_{farm.id}_{report_date}.pdf",
+        "caption": caption,
+    })
+
+
+def _enqueue(phone, kind, payload):
+    message = OutboundMessage.objects.create(
+        phone=phone, kind=kind, payload=payload
+    )
+    transaction.on_commit(dispatch_outbound)
+    return message
+
+
+# ==================================================
+# In-process wake-up
+# ==================================================
+# One background drain at a time; deliver_outbound_messages covers
+# anything left behind by a crash or restart
+_executor = None
+_wakeup_queued = False
+_wakeup_lock = threading.Lock()
+
+
+def dispatch_outbound():
+    """
+    Start draining the outbox in the background, unless a drain is
+    already queued and will pick up the new messages anyway.
+    """
+    global _executor, _wakeup_queued
+    with _wakeup_lock:
+        if _wakeup_queued:
+            return
+        _wakeup_queued = True
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="outbound"
+            )
+    _executor.submit(_run_in_worker)
+
+
+def _run_in_worker():
+    global _wakeup_queued
+    with _wakeup_lock:
+        _wakeup_queued = False
+    try:
+        deliver_pending()
+    finally:
+        # Worker threads own their connections; don't leak them
+        connection.close()
+
+
+# ==================================================
+# Delivery
+# ==================================================
+def claim_batch(batch_size):
+    """
+    Claim due messages for delivery, at most one per phone.
+
+    A message is only due once every earlier message to the same phone is
+    sent or dead, so conversations arrive in order even across retries.
+    ``SKIP LOCKED`` lets several workers claim disjoint batches.
+    """
+    now = timezone.now()
+    earlier_unfinished = OutboundMessage.objects.filter(
+        phone=OuterRef("phone"),
+        id__lt=OuterRef("id"),
+        status__in=[OutboundMessage.PENDING, OutboundMessage.SENDING],
+    )
+    with transaction.atomic():
+        batch = list(
+            OutboundMessage.objects
+            .filter(status=OutboundMessage.PENDING, next_attempt_at__lte=now)
+            .filter(~Exists(earlier_unfinished))
+            .select_for_update(skip_locked=True)
+            .order_by("id")[:batch_size]
+        )
+        OutboundMessage.objects.filter(
+            pk__in=[message.pk for message in batch]
+        ).update(
+            status=OutboundMessage.SENDING,
+            started_at=now,
+            attempts=F("attempts") + 1,
+        )
+
+    for message in batch:
+        message.status = OutboundMessage.SENDING
+        message.attempts += 1
+    return batch
+
+
+def deliver_pending(batch_size=None, workers=None):
+    """
+    Deliver due outbox messages batch by batch until none are left.
+
+    Each message goes out from its recipient's sender number, so a batch
+    spread over several numbers is limited by each number's own rate.
+    Returns a dict counting messages ``sent``, ``retried`` (scheduled for
+    another attempt) and ``dead`` (given up on).
+    """
+    batch_size = batch_size or settings.OUTBOUND_BATCH_SIZE
+    workers = workers or settings.OUTBOUND_WORKERS
+    counts = {"sent": 0, "retried": 0, "dead": 0}
+
+    def deliver_in_thread(message):
+        try:
+            return deliver_message(message)
+        finally:
+            connection.close()
+
+    while True:
+        batch = claim_batch(batch_size)
+        if not batch:
+            return counts
+
+        if workers <= 1:
+            outcomes = [deliver_message(message) for message in batch]
+        else:
+            with ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="outbound-send"
+            ) as pool:
+                outcomes = list(pool.map(deliver_in_thread, batch))
+
+        for outcome in outcomes:
+            counts[outcome] += 1
+
+
+def deliver_message(message):
+    """
+    Send one claimed message and record the outcome: ``"sent"``,
+    ``"retried"`` or ``"dead"``.
+    """
+    try:
+        response = _send(message, get_sender(message.phone))
+    except Exception as e:
+        return _record_failure(message, e)
+
+    OutboundMessage.objects.filter(pk=message.pk).update(
+        status=OutboundMessage.SENT,
+        sent_at=timezone.now(),
+        last_error="",
+        wa_message_id=_message_id(response),
+    )
+    return "sent"
+
+
+def _send(message, client):
+    payload = message.payload
+
+    if message.kind == OutboundMessage.TEXT:
+        return client.send_text(message.phone, payload["text"])
+
+    if message.kind == OutboundMessage.REPORT:
+        farm = Farm.objects.get(pk=payload["farm_id"])
+        with open_report(
+            farm, parse_date(payload["date"]), profile=payload["profile"]
+        ) as pdf:
+            media_id = get_or_upload_media(pdf, payload["filename"], client=client)
+        return client.send_document(message.phone, media_id, payload["caption"])
+
+    raise UnknownMessageKind(f"Unknown outbound message kind {message.kind!r}")
+
+
+def _record_failure(message, error):
+    if _is_permanent(error) or message.attempts >= settings.OUTBOUND_MAX_ATTEMPTS:
+        OutboundMessage.objects.filter(pk=message.pk).update(
+            status=OutboundMessage.DEAD,
+            last_error=repr(error),
+        )
+        return "dead"
+
+    OutboundMessage.objects.filter(pk=message.pk).update(
+        status=OutboundMessage.PENDING,
+        last_error=repr(error),
+        next_attempt_at=timezone.now() + timedelta(
+            seconds=_retry_delay(message.attempts)
+        ),
+    )
+    return "retried"
+
+
+def _is_permanent(error):
+    """
+    Errors a retry cannot fix: bad requests (other than rate limiting),
+    missing farms, malformed payloads and unknown message kinds.
+
+    Anything else, including 5xx responses and unreadable response bodies
+    (requests' JSONDecodeError is a ValueError), is retried.
+    """
+    if isinstance(error, (ObjectDoesNotExist, KeyError, UnknownMessageKind)):
+        return True
+    response = getattr(error, "response", None)
+    return (
+        isinstance(error, requests.HTTPError)
+        and response is not None
+        and 400 <= response.status_code < 500
+        and response.status_code != 429
+    )
+
+
+def _retry_delay(attempts):
+    # Jittered exponential backoff, never shorter than half the step
+    ceiling = min(
+        settings.OUTBOUND_RETRY_MAX_SECONDS,
+        settings.OUTBOUND_RETRY_BASE_SECONDS * (2 ** (attempts - 1)),
+    )
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def _message_id(response):
+    try:
+        return response.json()["messages"][0]["id"]
+    except (AttributeError, ValueError, KeyError, IndexError, TypeError):
+        return ""
+
+
+def requeue_stale(minutes=None):
+    """
+    Return messages stuck in sending (e.g. after a worker crash) to the
+    pending queue. Delivery is at-least-once: a message sent right before
+    a crash may go out twice.
+    """
+    if minutes is None:
+        minutes = settings.OUTBOUND_STALE_AFTER_MINUTES
+
+    return (
+        OutboundMessage.objects
+        .filter(
+            status=OutboundMessage.SENDING,
+            started_at__lt=timezone.now() - timedelta(minutes=minutes),
+        )
+        .update(status=OutboundMessage.PENDING)
+    )
@@ -0,0 +1,75 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPaginator:
+    """
+    Keyset (seek) pagination over ``(date, created_at, id)``, newest first.
+
+    Each page is one indexed range scan regardless of how deep the client
+    has paged, unlike OFFSET pagination.
+    """
+    ordering = ("-date", "-created_at", "-id")
+
+    def __init__(self, default_page_size=100, max_page_size=500):
+        self.default_page_size = default_page_size
+        self.max_page_size = max_page_size
+
+    def get_page_size(self, value):
+        try:
+            size = int(value)
+        except (TypeError, ValueError):
+            return self.default_page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, record):
+        raw = json.dumps([
+            record.date.isoformat(),
+            record.created_at.isoformat(),
+            record.id,
+        ])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            day, created_at, pk = raw
+            day = parse_date(day)
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (ValueError, TypeError, json.JSONDecodeError):
+            raise InvalidCursor(cursor)
+
+        if day is None or created_at is None:
+            raise InvalidCursor(cursor)
+        return day, created_at, pk
+
+    def paginate(self, queryset, cursor=None, page_size=None):
+        """
+        Return ``(records, next_cursor)``; ``next_cursor`` is None on the
+        last page.
+        """
+        page_size = page_size or self.default_page_size
+        queryset = queryset.order_by(*self.ordering)
+
+        if cursor:
+            day, created_at, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(date__lt=day)
+                | Q(date=day, created_at__lt=created_at)
+                | Q(date=day, created_at=created_at, id__lt=pk)
+            )
+
+        records = list(queryset[:page_size + 1])
+        if len(records) <= page_size:
+            return records, None
+
+        records = records[:page_size]
+        return records, self.encode_cursor(records[-1])
@@ -1,105 +1,93 @@
-import os
+import logging
+from contextlib import contextmanager
 from datetime import date, timedelta
 from decimal import Decimal
-from uuid import uuid4
-from pathlib import Path
-from django.conf import settings
-from django.db.models import Sum
+from io import BytesIO
 
 from reportlab.platypus import (
     SimpleDocTemplate,
     Paragraph,
     Spacer,
     Table,
-    TableStyle,
 )
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from django.conf import settings
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4, landscape, portrait
 from reportlab.lib import colors
 from reportlab.lib.units import cm
 from reportlab.graphics.shapes import Drawing
 from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.charts.legends import Legend
+from reportlab.graphics.charts.linecharts import HorizontalLineChart
 from reportlab.graphics.charts.piecharts import Pie
 
 from production.models import MilkRecord
-from accounts.models import Cow
+from production.utils.report_data import SESSIONS, RangeReportData, load_daily_report_data
+from production.utils.report_template import get_report_template
+
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def binary_streams():
+    """
+    Write compressed streams as raw binary rather than ASCII85 text, which
+    inflates them by a quarter. reportlab only reads this from its global
+    config, so it is set for the duration of one build and restored; a
+    build overlapping on another thread still produces a valid PDF.
+    """
+    previous = rl_config.useA85
+    rl_config.useA85 = 0
+    try:
+        yield
+    finally:
+        rl_config.useA85 = previous
 
 
 class MilkProductionPDFReport:
     """
     Executive-style milk production report (WhatsApp friendly).
+
+    ``render`` builds the PDF in memory. Given a preloaded ``data`` set,
+    ``farm`` may be None, so render workers never need ORM objects.
+
+    The ``mobile`` profile targets phones on slow links: portrait page,
+    plain text cells, one small chart, no logo, and the chart is dropped
+    if the file would exceed ``REPORT_MOBILE_MAX_BYTES``.
     """
-    def __init__(self, farm):
+    PROFILES = ("standard", "mobile")
+
+    def __init__(self, farm, report_date=None, data=None, profile="standard"):
+        if profile not in self.PROFILES:
+            raise ValueError(f"Unknown report profile {profile!r}")
+        self.profile = profile
+        self.mobile = profile == "mobile"
+        self.charts = True
         self.farm = farm
-        self.today = date.today()
+        if data is not None:
+            report_date = data.today
+        self.today = report_date or date.today()
         self.yesterday = self.today - timedelta(days=1)
+        self._data = data
 
-        # -------------------------
-        # Styles
-        # -------------------------
-        self.styles = getSampleStyleSheet()
-
-        self.styles.add(ParagraphStyle(
-            name="TitleMain",
-            fontSize=18,
-            alignment=1,
-            spaceAfter=6,
-        ))
-
-        self.styles.add(ParagraphStyle(
-            name="SubTitle",
-            fontSize=11,
-            alignment=1,
-            textColor=colors.grey,
-            spaceAfter=18,
-        ))
-
-        self.styles.add(ParagraphStyle(
-            name="Cell",
-            fontSize=9,
-            alignment=1,
-        ))
-
-        self.styles.add(ParagraphStyle(
-            name="Narration",
-            fontSize=10,
-            alignment=1,
-            leading=14,
-        ))
-
-        # -------------------------
-        # Output path (git ignored)
-        # -------------------------
-        reports_dir = Path(settings.MEDIA_ROOT).resolve() / "reports"
-        reports_dir.mkdir(parents=True, exist_ok=True)
-        self.file_path = reports_dir / (
-            f"milk_report_farm_{farm.id}_{self.today}_{uuid4().hex}.pdf"
-        )
+        self.template = get_report_template()
+        self.styles = self.template.styles
 
     # ==================================================
-    # Data helpers
+    # Data
     # ==================================================
-    def _get_value(self, cow, session, target_date):
-        return (
-            MilkRecord.objects
-            .filter(cow=cow, date=target_date, session=session)
-            .aggregate(total=Sum("quantity_in_liters"))["total"]
-            or Decimal("0")
-        )
-
-    def _get_total_for_date(self, target_date):
-        return (
-            MilkRecord.objects
-            .filter(cow__farm=self.farm, date=target_date)
-            .aggregate(total=Sum("quantity_in_liters"))["total"]
-            or Decimal("0")
-        )
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = load_daily_report_data(self.farm, self.today)
+        return self._data
 
     # ==================================================
     # Analytical table
     # ==================================================
     def _build_table(self):
-        cows = Cow.objects.filter(farm=self.farm).order_by("id")
+        data = self.data
 
         table_data = [[
             "Cow",
@@ -119,8 +107,8 @@ class MilkProductionPDFReport:
         best = None
         worst = None
 
-        for cow in cows:
-            row = [cow.name or cow.tag_number]
+        for cow in data.cows:
+            row = [cow.label]
             cow_total = Decimal("0")
 
             for session, key in [
@@ -128,42 +116,29 @@ class MilkProductionPDFReport:
                 (MilkRecord.AFTERNOON, "noon"),
                 (MilkRecord.EVENING, "evening"),
             ]:
-                today_val = self._get_value(cow, session, self.today)
-                yesterday_val = self._get_value(cow, session, self.yesterday)
+                today_val = data.value(cow.id, session, self.today)
+                yesterday_val = data.value(cow.id, session, self.yesterday)
                 diff = today_val - yesterday_val
 
-                if diff > 0:
-                    arrow = '<font color="green">↑</font>'
-                elif diff < 0:
-                    arrow = '<font color="red">↓</font>'
+                if self.mobile:
+                    cell = f"{today_val:.2f} ({diff:+.2f})"
                 else:
-                    arrow = '<font color="grey">→</font>'
-
-                cell = Paragraph(
-                    f"{today_val:.2f} "
-                    f"<font size='7'>({diff:+.2f})</font> {arrow}",
-                    self.styles["Cell"],
-                )
+                    cell = self.template.delta_cell(today_val, diff)
 
                 row.append(cell)
                 totals[key] += today_val
                 cow_total += today_val
 
-            yesterday_total = (
-                self._get_value(cow, MilkRecord.MORNING, self.yesterday)
-                + self._get_value(cow, MilkRecord.AFTERNOON, self.yesterday)
-                + self._get_value(cow, MilkRecord.EVENING, self.yesterday)
-            )
+            yesterday_total = data.cow_total(cow.id, self.yesterday)
 
             total_diff = cow_total - yesterday_total
 
-            row.append(
-                Paragraph(
-                    f"{cow_total:.2f} "
-                    f"<font size='7'>({total_diff:+.2f})</font>",
-                    self.styles["Cell"],
+            if self.mobile:
+                row.append(f"{cow_total:.2f} ({total_diff:+.2f})")
+            else:
+                row.append(
+                    self.template.delta_cell(cow_total, total_diff, arrow=False)
                 )
-            )
 
             totals["total"] += cow_total
 
@@ -183,28 +158,20 @@ class MilkProductionPDFReport:
             f"{totals['total']:.2f}",
         ])
 
-        table = Table(
-            table_data,
-            colWidths=[4*cm, 4*cm, 4*cm, 4*cm, 4*cm],
-            repeatRows=1,
-        )
-
-        table.setStyle(TableStyle([
-            ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#0A2E5C")),
-            ("TEXTCOLOR", (0,0), (-1,0), colors.white),
-            ("FONT", (0,0), (-1,0), "Helvetica-Bold"),
-
-            ("ROWBACKGROUNDS", (0,1), (-1,-2),
-             [colors.whitesmoke, colors.transparent]),
-
-            ("FONT", (0,1), (0,-2), "Helvetica-Bold"),
-            ("ALIGN", (1,1), (-1,-1), "CENTER"),
-            ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
-            ("GRID", (0,0), (-1,-1), 0.5, colors.grey),
-
-            ("BACKGROUND", (0,-1), (-1,-1), colors.lightgrey),
-            ("FONT", (0,-1), (-1,-1), "Helvetica-Bold"),
-        ]))
+        if self.mobile:
+            table = Table(
+                table_data,
+                colWidths=[4.6*cm, 3.6*cm, 3.6*cm, 3.6*cm, 3.6*cm],
+                repeatRows=1,
+            )
+            table.setStyle(self.template.mobile_table_style)
+        else:
+            table = Table(
+                table_data,
+                colWidths=[4*cm, 4*cm, 4*cm, 4*cm, 4*cm],
+                repeatRows=1,
+            )
+            table.setStyle(self.template.milk_table_style)
 
         return table, best, worst, totals
 
@@ -221,9 +188,8 @@ class MilkProductionPDFReport:
 
         pie.data = [float(morning), float(noon), float(evening)]
         pie.labels = ["Morning", "Noon", "Evening"]
-        pie.slices[0].fillColor = colors.HexColor("#1f77b4")
-        pie.slices[1].fillColor = colors.HexColor("#ff7f0e")
-        pie.slices[2].fillColor = colors.HexColor("#2ca02c")
+        for i, color in enumerate(self.template.session_colors):
+            pie.slices[i].fillColor = color
 
         d.add(pie)
         return d
@@ -261,12 +227,13 @@ class MilkProductionPDFReport:
         chart.width = 180
 
         # 🎨 Correct color logic (PER BAR)
+        up, down = self.template.up_color, self.template.down_color
         if today_total > yesterday_total:
-            chart.bars[(0, 0)].fillColor = colors.HexColor("#c62828")    # Yesterday
-            chart.bars[(0, 1)].fillColor = colors.HexColor("#2e7d32")   # Today
+            chart.bars[(0, 0)].fillColor = down    # Yesterday
+            chart.bars[(0, 1)].fillColor = up      # Today
         elif today_total < yesterday_total:
-            chart.bars[(0, 0)].fillColor = colors.HexColor("#2e7d32")   # Yesterday
-            chart.bars[(0, 1)].fillColor = colors.HexColor("#c62828")    # Today
+            chart.bars[(0, 0)].fillColor = up      # Yesterday
+            chart.bars[(0, 1)].fillColor = down    # Today
         else:
             chart.bars[(0, 0)].fillColor = colors.grey
             chart.bars[(0, 1)].fillColor = colors.grey
@@ -284,35 +251,50 @@ class MilkProductionPDFReport:
 
         if best and best[1] > 0:
             lines.append(
-                f"{best[0].name} recorded the strongest improvement in milk yield."
+                f"{best[0].label} recorded the strongest improvement in milk yield."
             )
 
         if worst and worst[1] < 0:
             lines.append(
-                f"{worst[0].name} recorded the largest decline in production."
+                f"{worst[0].label} recorded the largest decline in production."
             )
 
         return Paragraph("<br/>".join(lines), self.styles["Narration"])
 
-    # ==================================================
-    # Footer
-    # ==================================================
-    def _footer(self, canvas, doc):
-        canvas.setFont("Helvetica", 9)
-        canvas.drawString(
-            2*cm, 1.2*cm,
-            "Generated by Farmgate • Confidential"
-        )
-
     # ==================================================
     # Build PDF
     # ==================================================
-    def generate(self):
-        import os
-        print("PDF PATH USED:", self.file_path)
-        print("CWD:", os.getcwd())
+    def render(self):
+        """
+        Build the PDF into memory and return it as a rewound buffer.
+        """
+        buffer = BytesIO()
+        self._build(buffer)
+
+        # Over budget: drop the chart, the only optional part left
+        budget = settings.REPORT_MOBILE_MAX_BYTES
+        if self.mobile and budget and buffer.getbuffer().nbytes > budget:
+            self.charts = False
+            buffer = BytesIO()
+            self._build(buffer)
+
+            size = buffer.getbuffer().nbytes
+            if size > budget:
+                logger.warning(
+                    "Mobile report for %s on %s is %d bytes without its "
+                    "chart, over the %d byte budget",
+                    self.data.farm_name, self.today, size, budget,
+                )
+
+        buffer.seek(0)
+        return buffer
+
+    def _build(self, output):
+        if self.mobile:
+            return self._build_mobile(output)
+
         doc = SimpleDocTemplate(
-            str(self.file_path.resolve()),
+            output,
             pagesize=landscape(A4),
             leftMargin=1*cm,
             rightMargin=1*cm,
@@ -326,7 +308,7 @@ class MilkProductionPDFReport:
         elements.append(Paragraph("Milk Production Report", self.styles["TitleMain"]))
         elements.append(
             Paragraph(
-                f"{self.farm.name} • {self.today}",
+                f"{self.data.farm_name} • {self.today}",
                 self.styles["SubTitle"],
             )
         )
@@ -340,11 +322,7 @@ class MilkProductionPDFReport:
             Table(
                 [[self._narration(best, worst)]],
                 colWidths=[20*cm],
-                style=[
-                    ("BOX", (0,0), (-1,-1), 0.75, colors.HexColor("#0A2E5C")),
-                    ("BACKGROUND", (0,0), (-1,-1), colors.HexColor("#F4F7FB")),
-                    ("PAD", (0,0), (-1,-1), 14),
-                ],
+                style=self.template.narration_style,
             )
         )
         elements.append(Spacer(1, 10))
@@ -356,7 +334,7 @@ class MilkProductionPDFReport:
             totals["evening"],
         )
         comparison_chart = self._comparison_chart(
-            self._get_total_for_date(self.yesterday),
+            self.data.total(self.yesterday),
             totals["total"],
         )
 
@@ -374,30 +352,251 @@ class MilkProductionPDFReport:
             colWidths=[10*cm, 10*cm],
         )
 
-        charts_table.setStyle(TableStyle([
-            ("ALIGN", (0,0), (-1,-1), "CENTER"),
-            ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+        charts_table.setStyle(self.template.charts_style)
+
+        elements.append(charts_table)
+        elements.append(Spacer(1, 5))
+        doc.build(
+            elements,
+            onFirstPage=self.template.draw_first_page,
+            onLaterPages=self.template.draw_footer,
+        )
+
+    def _build_mobile(self, output):
+        doc = SimpleDocTemplate(
+            output,
+            pagesize=portrait(A4),
+            leftMargin=1*cm,
+            rightMargin=1*cm,
+            topMargin=1*cm,
+            bottomMargin=1*cm,
+            pageCompression=1,
+        )
+
+        table, best, worst, totals = self._build_table()
+        elements = [
+            Paragraph("Milk Production Report", self.styles["TitleMain"]),
+            Paragraph(f"{self.data.farm_name} • {self.today}", self.styles["SubTitle"]),
+            table,
+            Spacer(1, 12),
+            self._narration(best, worst),
+        ]
+
+        if self.charts:
+            elements += [
+                Spacer(1, 12),
+                self._comparison_chart(self.data.total(self.yesterday), totals["total"]),
+            ]
+
+        with binary_streams():
+            doc.build(
+                elements,
+                onFirstPage=self.template.draw_footer,
+                onLaterPages=self.template.draw_footer,
+            )
 
-            # Optional framing (recommended)
-            ("BOX", (0,1), (0,1), 0.5, colors.lightgrey),
-            ("BOX", (1,1), (1,1), 0.5, colors.lightgrey),
 
-            ("BACKGROUND", (0,1), (0,1), colors.whitesmoke),
-            ("BACKGROUND", (1,1), (1,1), colors.whitesmoke),
+class MilkRangePDFReport:
+    """
+    Weekly / monthly production report built from ``RangeReportData``.
 
-            ("LEFTPADDING", (0,0), (-1,-1), 12),
-            ("RIGHTPADDING", (0,0), (-1,-1), 12),
-            ("TOPPADDING", (0,0), (-1,-1), 12),
-            ("BOTTOMPADDING", (0,0), (-1,-1), 12),
-        ]))
+    The cow table is emitted in fixed-size chunks rather than one huge
+    table, so layout work and memory stay bounded for large herds.
+    """
+    ROWS_PER_TABLE = 40
+    TITLES = {"week": "Weekly", "month": "Monthly"}
+
+    def __init__(self, data):
+        self.data = data
+        self.template = get_report_template()
+        self.styles = self.template.styles
+
+    # ==================================================
+    # Summary
+    # ==================================================
+    def _summary(self):
+        data = self.data
+        daily = data.daily_totals()
+        total = data.total()
+        recorded = [qty for qty in daily if qty]
+        best = max(range(len(daily)), key=daily.__getitem__) if recorded else None
+
+        cells = [
+            ("Total milk", f"{total:.2f} L"),
+            (
+                "Daily average",
+                f"{total / len(recorded):.2f} L" if recorded else "-",
+            ),
+            (
+                "Best day",
+                f"{data.days[best]:%a %d %b} ({daily[best]:.2f} L)" if best is not None else "-",
+            ),
+            ("Cows", str(len(data.cows))),
+        ]
+        return Table(
+            [
+                [Paragraph(f"<b>{label}</b>", self.styles["Cell"]) for label, _ in cells],
+                [Paragraph(value, self.styles["Cell"]) for _, value in cells],
+            ],
+            colWidths=[6*cm] * len(cells),
+            style=self.template.narration_style,
+        )
+
+    # ==================================================
+    # Trend chart
+    # ==================================================
+    def _trend_chart(self):
+        data = self.data
+        drawing = Drawing(24*cm, 6.5*cm)
+
+        chart = HorizontalLineChart()
+        chart.x = 40
+        chart.y = 30
+        chart.width = 24*cm - 160
+        chart.height = 6.5*cm - 50
+        chart.data = [list(data.farm_sessions[s]) for s in SESSIONS] + [data.daily_totals()]
+        chart.valueAxis.valueMin = 0
+
+        # Label about eight days whatever the range length
+        every = max(1, len(data.days) // 8)
+        chart.categoryAxis.categoryNames = [
+            f"{day:%d %b}" if i % every == 0 else ""
+            for i, day in enumerate(data.days)
+        ]
+        chart.categoryAxis.labels.fontSize = 7
+        chart.valueAxis.labels.fontSize = 7
+
+        line_colors = self.template.session_colors + [self.template.up_color]
+        for i, color in enumerate(line_colors):
+            chart.lines[i].strokeColor = color
+            chart.lines[i].strokeWidth = 1.5 if i == len(SESSIONS) else 1
+
+        legend = Legend()
+        legend.x = chart.x + chart.width + 20
+        legend.y = chart.y + chart.height
+        legend.fontSize = 8
+        legend.colorNamePairs = list(zip(line_colors, ["Morning", "Noon", "Evening", "Total"]))
+
+        drawing.add(chart)
+        drawing.add(legend)
+        return drawing
+
+    # ==================================================
+    # Tables
+    # ==================================================
+    def _cow_tables(self):
+        data = self.data
+        header = [
+            "Cow", "Morning (L)", "Noon (L)", "Evening (L)",
+            "Total (L)", "Avg/day (L)", "Days", "Trend",
+        ]
+        widths = [5*cm, 2.8*cm, 2.8*cm, 2.8*cm, 2.8*cm, 2.8*cm, 1.8*cm, 5*cm]
+
+        for offset in range(0, len(data.cows), self.ROWS_PER_TABLE):
+            rows = [header]
+            for cow in data.cows[offset:offset + self.ROWS_PER_TABLE]:
+                rows.append([
+                    cow.label,
+                    *(f"{qty:.2f}" for qty in data.cow_sessions[cow.id]),
+                    f"{data.cow_total(cow.id):.2f}",
+                    f"{data.cow_average(cow.id):.2f}",
+                    str(data.cow_days(cow.id)),
+                    self.template.sparkline(data.series[cow.id]),
+                ])
+            yield Table(
+                rows,
+                colWidths=widths,
+                repeatRows=1,
+                style=self.template.range_table_style,
+            )
+
+        yield Table(
+            [[
+                "TOTAL",
+                *(f"{data.session_total(session):.2f}" for session in SESSIONS),
+                f"{data.total():.2f}",
+                "", "", "",
+            ]],
+            colWidths=widths,
+            style=self.template.range_totals_style,
+        )
+
+    def _day_tables(self):
+        """
+        Single-cow report: one row per day.
+        """
+        data = self.data
+        header = ["Date", "Morning (L)", "Noon (L)", "Evening (L)", "Total (L)"]
+        widths = [5*cm, 4*cm, 4*cm, 4*cm, 4*cm]
+        daily = data.daily_totals()
+
+        for offset in range(0, len(data.days), self.ROWS_PER_TABLE):
+            rows = [header]
+            for i in range(offset, min(offset + self.ROWS_PER_TABLE, len(data.days))):
+                rows.append([
+                    f"{data.days[i]:%a %d %b %Y}",
+                    *(f"{data.farm_sessions[s][i]:.2f}" for s in SESSIONS),
+                    f"{daily[i]:.2f}",
+                ])
+            yield Table(
+                rows,
+                colWidths=widths,
+                repeatRows=1,
+                style=self.template.range_table_style,
+            )
+
+    # ==================================================
+    # Build PDF
+    # ==================================================
+    def render(self):
+        buffer = BytesIO()
+        self._build(buffer)
+        buffer.seek(0)
+        return buffer
+
+    def _build(self, output):
+        data = self.data
+        doc = SimpleDocTemplate(
+            output,
+            pagesize=landscape(A4),
+            leftMargin=1*cm,
+            rightMargin=1*cm,
+            topMargin=1*cm,
+            bottomMargin=1*cm,
+        )
+
+        title = f"{self.TITLES.get(data.period, '')} Milk Production Report".strip()
+        subject = data.farm_name
+        if len(data.cows) == 1:
+            subject = f"{data.farm_name} • {data.cows[0].label}"
+
+        elements = [
+            Paragraph(title, self.styles["TitleMain"]),
+            Paragraph(
+                f"{subject} • {data.start:%d %b %Y} – {data.end:%d %b %Y}",
+                self.styles["SubTitle"],
+            ),
+            self._summary(),
+            Spacer(1, 12),
+            self._trend_chart(),
+            Spacer(1, 12),
+        ]
+        if len(data.cows) == 1:
+            elements.extend(self._day_tables())
+        else:
+            elements.extend(self._cow_tables())
 
-        elements.append(charts_table)
-        elements.append(Spacer(1, 5))
         doc.build(
             elements,
-            onFirstPage=self._footer,
-            onLaterPages=self._footer,
+            onFirstPage=self.template.draw_first_page,
+            onLaterPages=self.template.draw_footer,
         )
 
-        return str(self.file_path)
 
+def build_report(data, profile="standard"):
+    """
+    The report for a data payload. Range reports have a single profile.
+    """
+    if isinstance(data, RangeReportData):
+        return MilkRangePDFReport(data)
+    return MilkProductionPDFReport(None, data=data, profile=profile)
@@ -0,0 +1,70 @@
+from django.db import transaction
+
+from production.models import MilkRecord
+from production.utils.rollups import refresh_milk_rollups
+
+
+UPSERT_FIELDS = ["quantity_in_liters", "notes", "recorded_by", "updated_at"]
+
+
+def upsert_milk_records(
+    rows, recorded_by=None, return_records=False, update_fields=UPSERT_FIELDS
+):
+    """
+    Insert or update milk records in one set-based statement and refresh
+    the daily rollups they touch, all in one transaction.
+
+    ``rows`` are dicts with ``cow_id``, ``date``, ``session``,
+    ``quantity_in_liters`` and optionally ``notes``. Rows sharing a
+    (cow, date, session) key collapse to the last one, as a single
+    ``INSERT ... ON CONFLICT`` cannot touch the same row twice.
+
+    ``update_fields`` limits which columns an existing record takes from
+    the new row. With ``return_records`` the stored records are read back (one more
+    query) and returned keyed by (cow_id, date, session).
+    """
+    latest = {}
+    for row in rows:
+        latest[(row["cow_id"], row["date"], row["session"])] = row
+
+    if not latest:
+        return {}
+
+    objs = [
+        MilkRecord(
+            cow_id=row["cow_id"],
+            date=row["date"],
+            session=row["session"],
+            quantity_in_liters=row["quantity_in_liters"],
+            notes=row.get("notes", ""),
+            recorded_by=recorded_by,
+        )
+        for row in latest.values()
+    ]
+
+    with transaction.atomic():
+        MilkRecord.objects.bulk_create(
+            objs,
+            update_conflicts=True,
+            unique_fields=["cow", "date", "session"],
+            update_fields=update_fields,
+        )
+        refresh_milk_rollups((cow_id, day) for cow_id, day, _ in latest)
+
+        if not return_records:
+            return {}
+
+        stored = (
+            MilkRecord.objects
+            .select_related("cow")
+            .filter(
+                cow_id__in={key[0] for key in latest},
+                date__in={key[1] for key in latest},
+                session__in={key[2] for key in latest},
+            )
+        )
+        return {
+            (record.cow_id, record.date, record.session): record
+            for record in stored
+            if (record.cow_id, record.date, record.session) in latest
+        }
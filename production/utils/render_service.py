@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+def _init_worker():
+    """
+    Warm a render process: set up Django, then pay the reportlab import
+    and report template costs once instead of on the first job.
+    """
+    import django
+
+    django.setup()
+
+    from production.utils.report_template import get_report_template
+
+    get_report_template()
+
+
+def _render(data, profile="standard"):
+    """
+    Render one report from a ``DailyReportData`` or ``RangeReportData``
+    payload.
+
+    Returns ``(pdf_bytes, render_seconds)``.
+    """
+    from production.utils.pdf import build_report
+
+    started = time.perf_counter()
+    pdf = build_report(data, profile).render().getvalue()
+    return pdf, time.perf_counter() - started
+
+
+class RenderService:
+    """
+    Renders PDFs in a pool of warm worker processes, so CPU-bound
+    reportlab work stays off web workers and the GIL.
+
+    Jobs are plain report data payloads, never ORM objects. With
+    ``workers=0`` jobs render inline in the calling process (development
+    and tests). ``stats()`` exposes queue depth and render timings, and
+    they are logged every ``REPORT_RENDER_STATS_INTERVAL`` seconds.
+
+    A worker process that dies (killed, out of memory) breaks the whole
+    pool; the next render replaces the pool and is retried once.
+    """
+    def __init__(self, workers, timeout=None, history=500):
+        self.workers = workers
+        self.timeout = timeout if timeout is not None else settings.REPORT_RENDER_TIMEOUT
+        self.pool = self._start_pool()
+
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.restarts = 0
+        self._render_times = deque(maxlen=history)
+        self._wait_times = deque(maxlen=history)
+        self._stats_logged_at = time.monotonic()
+
+    def _start_pool(self):
+        if self.workers <= 0:
+            return None
+        # spawn: forking a threaded web worker is not safe
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def _restart_pool(self, broken):
+        # Only the first caller to see a broken pool replaces it
+        with _service_lock:
+            if self.pool is not broken:
+                return
+            logger.warning(
+                "Render pool broken (a worker process died), restarting it"
+            )
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.pool = self._start_pool()
+            with self._lock:
+                self.restarts += 1
+
+    def _submit_raw(self, data, profile):
+        pool = self.pool
+        try:
+            return pool.submit(_render, data, profile)
+        except BrokenProcessPool:
+            self._restart_pool(pool)
+            return self.pool.submit(_render, data, profile)
+
+    def submit(self, data, profile="standard"):
+        """
+        Queue a render and return a Future resolving to the PDF bytes.
+        """
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+
+        if self.pool is None:
+            raw = Future()
+            try:
+                raw.set_result(_render(data, profile))
+            except Exception as e:
+                raw.set_exception(e)
+        else:
+            raw = self._submit_raw(data, profile)
+
+        result = Future()
+
+        def finished(raw):
+            with self._lock:
+                self.queued -= 1
+                if raw.cancelled() or raw.exception() is not None:
+                    self.failed += 1
+                else:
+                    pdf, render_seconds = raw.result()
+                    self.completed += 1
+                    self._render_times.append(render_seconds)
+                    self._wait_times.append(
+                        time.perf_counter() - submitted - render_seconds
+                    )
+
+            if raw.cancelled():
+                result.cancel()
+            elif raw.exception() is not None:
+                result.set_exception(raw.exception())
+            else:
+                result.set_result(raw.result()[0])
+            self._log_stats()
+
+        raw.add_done_callback(finished)
+        result.raw = raw
+        result.pool = self.pool
+        return result
+
+    def render(self, data, profile="standard", timeout=None):
+        """
+        Render and wait for the PDF bytes, raising ``RenderTimeout`` if
+        the job is not done within ``timeout`` seconds.
+        """
+        future = self.submit(data, profile)
+        try:
+            try:
+                return future.result(timeout=timeout or self.timeout)
+            except BrokenProcessPool:
+                # The pool died under this job: replace it and retry once
+                self._restart_pool(future.pool)
+                future = self.submit(data, profile)
+                return future.result(timeout=timeout or self.timeout)
+        except FutureTimeout:
+            # Drop it if it never started; a running render just finishes
+            future.raw.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise RenderTimeout(
+                f"Report render did not finish within {timeout or self.timeout}s"
+            )
+
+    def stats(self):
+        with self._lock:
+            render_times = sorted(self._render_times)
+            wait_times = sorted(self._wait_times)
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+                "restarts": self.restarts,
+                "render_ms_avg": _avg_ms(render_times),
+                "render_ms_p95": _percentile_ms(render_times, 95),
+                "render_ms_max": _percentile_ms(render_times, 100),
+                "wait_ms_avg": _avg_ms(wait_times),
+                "wait_ms_p95": _percentile_ms(wait_times, 95),
+            }
+
+    def _log_stats(self):
+        interval = settings.REPORT_RENDER_STATS_INTERVAL
+        now = time.monotonic()
+        with self._lock:
+            if not interval or now - self._stats_logged_at < interval:
+                return
+            self._stats_logged_at = now
+        logger.info("Render service stats: %s", self.stats())
+
+    def shutdown(self, wait=True):
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def _avg_ms(values):
+    return round(sum(values) / len(values) * 1000, 1) if values else None
+
+
+def _percentile_ms(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))
+    return round(sorted_values[index] * 1000, 1)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_render_service():
+    """
+    Process-wide render service sized by ``REPORT_RENDER_WORKERS``.
+    """
+    global _service
+    workers = settings.REPORT_RENDER_WORKERS
+    if _service is None or _service.workers != workers:
+        with _service_lock:
+            if _service is None or _service.workers != workers:
+                if _service is not None:
+                    _service.shutdown(wait=False)
+                _service = RenderService(workers)
+    return _service
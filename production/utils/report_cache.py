@@ -0,0 +1,280 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from io import BytesIO
+from pathlib import Path
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max, Sum
+
+from production.models import FarmDailyMilk
+from production.utils.render_service import RenderTimeout, get_render_service
+from production.utils.report_data import load_daily_report_data
+from production.utils.singleflight import SingleFlightTimeout, single_flight
+from accounts.models import Cow
+
+
+logger = logging.getLogger(__name__)
+
+
+# Bump when the PDF layout changes so stale renders are not served.
+RENDERER_VERSION = "2"
+
+
+def report_cache_dir():
+    cache_dir = Path(settings.MEDIA_ROOT).resolve() / "reports" / "cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def get_data_version(farm, report_date):
+    """
+    Fingerprint of everything a farm's daily report is rendered from.
+
+    Any new, updated or deleted record for the report day or the day
+    before changes the farm rollups' record count or latest ``updated_at``.
+    """
+    return get_data_versions([farm.id], report_date)[farm.id]
+
+
+def get_data_versions(farm_ids, report_date):
+    """
+    ``get_data_version`` for many farms in two grouped queries.
+    """
+    farm_ids = set(farm_ids)
+    stats = {
+        row["farm_id"]: row
+        for row in (
+            FarmDailyMilk.objects
+            .filter(
+                farm_id__in=farm_ids,
+                date__in=[report_date - timedelta(days=1), report_date],
+            )
+            .values("farm_id")
+            .annotate(count=Sum("record_count"), latest=Max("updated_at"))
+            .order_by()
+        )
+    }
+    herds = dict(
+        Cow.objects
+        .filter(farm_id__in=farm_ids)
+        .values("farm_id")
+        .annotate(count=Count("id"))
+        .order_by()
+        .values_list("farm_id", "count")
+    )
+
+    versions = {}
+    for farm_id in farm_ids:
+        row = stats.get(farm_id, {})
+        latest = row["latest"].isoformat() if row.get("latest") else "-"
+        raw = (
+            f"{RENDERER_VERSION}:{row.get('count') or 0}:{latest}:"
+            f"{herds.get(farm_id, 0)}"
+        )
+        versions[farm_id] = hashlib.sha1(raw.encode()).hexdigest()[:16]
+    return versions
+
+
+def cached_report_path(farm_id, report_date, version, profile="standard"):
+    return (
+        report_cache_dir()
+        / f"farm_{farm_id}_{report_date}_{profile}_{version}.pdf"
+    )
+
+
+def render_report(farm, report_date=None, data=None, service=None,
+                  profile="standard"):
+    """
+    Render a farm's daily report to bytes on the render service.
+    """
+    if data is None:
+        data = load_daily_report_data(farm, report_date or date.today())
+    return (service or get_render_service()).render(data, profile)
+
+
+def get_or_generate_report(farm, report_date=None, data=None, version=None,
+                           service=None, profile="standard"):
+    """
+    Return the path of the farm's daily report, rendering it only when no
+    render exists for the current data version.
+
+    Batch callers can pass a preloaded ``data`` set and ``version`` to skip
+    the per-farm queries, and their own render ``service``. Each
+    ``profile`` is cached separately.
+    """
+    report_date = report_date or date.today()
+    if version is None:
+        version = get_data_version(farm, report_date)
+    path = cached_report_path(farm.id, report_date, version, profile)
+
+    if path.exists():
+        os.utime(path)
+        return str(path)
+
+    # Only one worker renders a given farm/day; the rest wait and reuse it
+    with single_flight(f"milk-report:{farm.id}:{report_date}:{profile}"):
+        if path.exists():
+            return str(path)
+
+        pdf = render_report(farm, report_date, data, service, profile)
+
+        # Write to a temp name and rename so readers never see partial files
+        tmp_path = path.with_name(f".{path.name}.{uuid4().hex}.tmp")
+        try:
+            tmp_path.write_bytes(pdf)
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        _drop_superseded(farm.id, report_date, profile, keep=path)
+
+    evict_reports()
+    return str(path)
+
+
+# Background cache warming, one render at a time, off request and inbound
+# threads
+_prewarm_executor = None
+_prewarm_lock = threading.Lock()
+
+
+def prewarm_report(farm, report_date, data=None, version=None,
+                   profile="standard"):
+    """
+    Render a farm's daily report into the cache in the background and
+    return the future without waiting on it.
+
+    Best effort: a failed render is logged and the report is simply
+    rendered again when it is asked for.
+    """
+    global _prewarm_executor
+    with _prewarm_lock:
+        if _prewarm_executor is None:
+            _prewarm_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="report-prewarm"
+            )
+    return _prewarm_executor.submit(
+        _prewarm, farm, report_date, data, version, profile
+    )
+
+
+def _prewarm(farm, report_date, data, version, profile):
+    try:
+        get_or_generate_report(farm, report_date, data, version, profile=profile)
+    except (RenderTimeout, SingleFlightTimeout):
+        # Someone else is rendering it, or the service is busy
+        pass
+    except Exception:
+        logger.exception(
+            "Prewarming the %s report for farm %s failed", profile, farm.id
+        )
+    finally:
+        # Worker threads own their connections; don't leak them
+        connection.close()
+
+
+def open_report(farm, report_date=None, data=None, version=None,
+                profile="standard"):
+    """
+    Return the farm's daily report as a binary file object for streaming.
+
+    Reads through the disk cache when ``REPORT_CACHE_ENABLED`` is on;
+    otherwise renders straight into memory and never touches disk.
+    """
+    if settings.REPORT_CACHE_ENABLED:
+        return open(
+            get_or_generate_report(
+                farm, report_date, data, version, profile=profile
+            ),
+            "rb",
+        )
+    return BytesIO(render_report(farm, report_date, data, profile=profile))
+
+
+def _drop_superseded(farm_id, report_date, profile, keep):
+    pattern = f"farm_{farm_id}_{report_date}_{profile}_*.pdf"
+    for old in report_cache_dir().glob(pattern):
+        if old != keep:
+            old.unlink(missing_ok=True)
+
+
+def evict_reports(max_age_days=None, max_bytes=None):
+    """
+    Remove cache entries older than ``max_age_days`` and then the least
+    recently used ones until the cache fits in ``max_bytes``.
+
+    Returns the number of files removed.
+    """
+    if max_age_days is None:
+        max_age_days = settings.REPORT_CACHE_MAX_AGE_DAYS
+    if max_bytes is None:
+        max_bytes = settings.REPORT_CACHE_MAX_BYTES
+
+    cutoff = time.time() - max_age_days * 24 * 60 * 60
+    removed = 0
+    entries = []
+
+    for path in report_cache_dir().glob("*.pdf"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+
+        if stat.st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            removed += 1
+        else:
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+
+    return removed
+
+
+def sweep_reports(max_age_days=None, max_bytes=None, min_age_minutes=None):
+    """
+    Retention sweep for ``MEDIA_ROOT/reports``.
+
+    Removes loose PDFs outside the cache (older releases wrote one file per
+    report there), temp files left behind by interrupted renders, and then
+    evicts the cache down to its age and size limits.
+
+    Loose and temp files younger than ``min_age_minutes`` are left alone:
+    they may still be written, served or resumed from.
+
+    Returns ``(loose, temp, evicted)`` file counts.
+    """
+    if min_age_minutes is None:
+        min_age_minutes = settings.REPORT_SWEEP_MIN_AGE_MINUTES
+    cutoff = time.time() - min_age_minutes * 60
+
+    reports_dir = report_cache_dir().parent
+    loose = _remove_older_than(reports_dir.glob("*.pdf"), cutoff)
+    temp = _remove_older_than(report_cache_dir().glob(".*.tmp"), cutoff)
+    return loose, temp, evict_reports(max_age_days, max_bytes)
+
+
+def _remove_older_than(paths, cutoff):
+    removed = 0
+    for path in paths:
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
@@ -0,0 +1,228 @@
+import calendar
+from array import array
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+
+from production.models import CowDailyMilk, MilkRecord
+from accounts.models import Cow
+
+
+SESSIONS = (MilkRecord.MORNING, MilkRecord.AFTERNOON, MilkRecord.EVENING)
+
+
+class CowRow(namedtuple("CowRow", ["id", "name", "tag_number"])):
+    """
+    Lightweight, picklable stand-in for a Cow inside report data.
+    """
+    __slots__ = ()
+
+    @property
+    def label(self):
+        return self.name or self.tag_number
+
+
+class DailyReportData:
+    """
+    In-memory pivot of a farm's per-cow, per-session milk totals for the
+    report day and the day before it.
+    """
+    def __init__(self, farm_id, farm_name, today, cows, values):
+        self.farm_id = farm_id
+        self.farm_name = farm_name
+        self.today = today
+        self.yesterday = today - timedelta(days=1)
+        self.cows = cows
+        # {(cow_id, date, session): Decimal}
+        self.values = values
+
+    def value(self, cow_id, session, target_date):
+        return self.values.get((cow_id, target_date, session), Decimal("0"))
+
+    def cow_total(self, cow_id, target_date):
+        return sum(
+            (self.value(cow_id, session, target_date) for session in SESSIONS),
+            Decimal("0"),
+        )
+
+    def session_total(self, session, target_date):
+        return sum(
+            (
+                qty for (_, day, s), qty in self.values.items()
+                if day == target_date and s == session
+            ),
+            Decimal("0"),
+        )
+
+    def total(self, target_date):
+        return sum(
+            (qty for (_, day, _), qty in self.values.items() if day == target_date),
+            Decimal("0"),
+        )
+
+
+def load_daily_report_data(farm, today=None):
+    """
+    Load today's and yesterday's per-cow, per-session totals for a farm.
+
+    Runs one query for the herd and one over the per-cow daily rollups, so
+    the cost stays flat regardless of herd size.
+    """
+    return load_daily_report_data_for_farms([farm], today)[farm.id]
+
+
+def load_daily_report_data_for_farms(farms, today=None):
+    """
+    Batch version of ``load_daily_report_data`` for many farms at once.
+
+    Uses the same two queries whatever the number of farms, and returns a
+    ``{farm_id: DailyReportData}`` dict.
+    """
+    today = today or date.today()
+    yesterday = today - timedelta(days=1)
+    farms = {farm.id: farm for farm in farms}
+
+    cows = defaultdict(list)
+    for farm_id, *cow in (
+        Cow.objects
+        .filter(farm_id__in=farms)
+        .order_by("farm_id", "id")
+        .values_list("farm_id", "id", "name", "tag_number")
+    ):
+        cows[farm_id].append(CowRow(*cow))
+
+    values = defaultdict(dict)
+    for farm_id, cow_id, day, *session_values in (
+        CowDailyMilk.objects
+        .filter(farm_id__in=farms, date__in=[yesterday, today])
+        .values_list("farm_id", "cow_id", "date", "morning", "afternoon", "evening")
+    ):
+        for session, qty in zip(SESSIONS, session_values):
+            if qty:
+                values[farm_id][(cow_id, day, session)] = qty
+
+    return {
+        farm_id: DailyReportData(
+            farm_id, farm.name, today, cows[farm_id], values[farm_id]
+        )
+        for farm_id, farm in farms.items()
+    }
+
+
+# ==================================================
+# Date ranges (weekly / monthly reports)
+# ==================================================
+PERIODS = ("week", "month")
+
+
+def report_period(period, anchor=None):
+    """
+    ``(start, end)`` of the week (Monday to Sunday) or calendar month
+    containing ``anchor``, with the end capped at today.
+    """
+    anchor = anchor or date.today()
+    if period == "week":
+        start = anchor - timedelta(days=anchor.weekday())
+        end = start + timedelta(days=6)
+    elif period == "month":
+        start = anchor.replace(day=1)
+        end = anchor.replace(day=calendar.monthrange(anchor.year, anchor.month)[1])
+    else:
+        raise ValueError(f"Unknown period {period!r}, expected one of {PERIODS}")
+    return start, min(end, max(date.today(), start))
+
+
+class RangeReportData:
+    """
+    A farm's daily milk series over a date range: per cow, per day totals
+    plus per-session totals, held as compact arrays so 30 days x 1,000
+    cows stays a few hundred KB.
+    """
+    def __init__(self, farm_id, farm_name, start, end, cows, period=None):
+        self.farm_id = farm_id
+        self.farm_name = farm_name
+        self.start = start
+        self.end = end
+        self.period = period
+        self.days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        self.cows = cows
+
+        # {cow_id: array of daily litres}
+        self.series = {cow.id: array("d", bytes(8 * len(self.days))) for cow in cows}
+        # {cow_id: [morning, afternoon, evening]}
+        self.cow_sessions = {cow.id: [Decimal("0")] * len(SESSIONS) for cow in cows}
+        # {session: array of daily litres for the whole farm}
+        self.farm_sessions = {
+            session: array("d", bytes(8 * len(self.days))) for session in SESSIONS
+        }
+
+    def add(self, cow_id, day, session_values):
+        if cow_id not in self.series:
+            return
+        index = (day - self.start).days
+        totals = self.cow_sessions[cow_id]
+        for i, (session, qty) in enumerate(zip(SESSIONS, session_values)):
+            if qty:
+                totals[i] += qty
+                self.series[cow_id][index] += float(qty)
+                self.farm_sessions[session][index] += float(qty)
+
+    def cow_total(self, cow_id):
+        return sum(self.cow_sessions[cow_id], Decimal("0"))
+
+    def cow_days(self, cow_id):
+        """Days the cow had any milk recorded."""
+        return sum(1 for qty in self.series[cow_id] if qty)
+
+    def cow_average(self, cow_id):
+        days = self.cow_days(cow_id)
+        return self.cow_total(cow_id) / days if days else Decimal("0")
+
+    def daily_totals(self):
+        return [
+            sum(self.farm_sessions[session][i] for session in SESSIONS)
+            for i in range(len(self.days))
+        ]
+
+    def session_total(self, session):
+        index = SESSIONS.index(session)
+        return sum(
+            (totals[index] for totals in self.cow_sessions.values()), Decimal("0")
+        )
+
+    def total(self):
+        return sum(
+            (self.cow_total(cow_id) for cow_id in self.cow_sessions), Decimal("0")
+        )
+
+
+def load_range_report_data(farm, start, end, cow_ids=None, period=None):
+    """
+    Load a farm's per-cow daily series between ``start`` and ``end``.
+
+    One query for the herd and one over the per-cow daily rollups,
+    streamed with ``iterator()`` so the rows are never all held at once.
+    """
+    cows = Cow.objects.filter(farm=farm)
+    if cow_ids:
+        cows = cows.filter(id__in=cow_ids)
+    data = RangeReportData(
+        farm.id,
+        farm.name,
+        start,
+        end,
+        [CowRow(*cow) for cow in cows.order_by("id").values_list("id", "name", "tag_number")],
+        period=period,
+    )
+
+    rows = CowDailyMilk.objects.filter(farm=farm, date__range=(start, end))
+    if cow_ids:
+        rows = rows.filter(cow_id__in=cow_ids)
+    for cow_id, day, *session_values in (
+        rows
+        .values_list("cow_id", "date", "morning", "afternoon", "evening")
+        .iterator(chunk_size=2000)
+    ):
+        data.add(cow_id, day, session_values)
+
+    return data
@@ -0,0 +1,289 @@
+from functools import lru_cache
+
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.platypus import Flowable, TableStyle
+
+
+FONT = "Helvetica"
+FONT_BOLD = "Helvetica-Bold"
+BRAND = colors.HexColor("#0A2E5C")
+
+LOGO_PATH = settings.BASE_DIR / "static" / "logo.png"
+LOGO_HEIGHT = 1.2*cm
+
+
+class ReportTemplate:
+    """
+    Everything about the report's look that does not depend on the data:
+    paragraph and table styles, fonts, palette and the logo.
+
+    Built once per process by ``get_report_template`` and shared
+    read-only by every render, so a report only has to fill in data.
+    """
+    def __init__(self):
+        # -------------------------
+        # Fonts (loads the metrics up front)
+        # -------------------------
+        for font in (FONT, FONT_BOLD):
+            pdfmetrics.getFont(font)
+
+        # -------------------------
+        # Paragraph styles
+        # -------------------------
+        self.styles = getSampleStyleSheet()
+
+        self.styles.add(ParagraphStyle(
+            name="TitleMain",
+            fontSize=18,
+            alignment=1,
+            spaceAfter=6,
+        ))
+
+        self.styles.add(ParagraphStyle(
+            name="SubTitle",
+            fontSize=11,
+            alignment=1,
+            textColor=colors.grey,
+            spaceAfter=18,
+        ))
+
+        self.styles.add(ParagraphStyle(
+            name="Cell",
+            fontSize=9,
+            alignment=1,
+        ))
+
+        self.styles.add(ParagraphStyle(
+            name="Narration",
+            fontSize=10,
+            alignment=1,
+            leading=14,
+        ))
+
+        # -------------------------
+        # Table styles
+        # -------------------------
+        self.milk_table_style = TableStyle([
+            ("BACKGROUND", (0,0), (-1,0), BRAND),
+            ("TEXTCOLOR", (0,0), (-1,0), colors.white),
+            ("FONT", (0,0), (-1,0), FONT_BOLD),
+
+            ("ROWBACKGROUNDS", (0,1), (-1,-2),
+             [colors.whitesmoke, colors.transparent]),
+
+            ("FONT", (0,1), (0,-2), FONT_BOLD),
+            ("ALIGN", (1,1), (-1,-1), "CENTER"),
+            ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+            ("GRID", (0,0), (-1,-1), 0.5, colors.grey),
+
+            ("BACKGROUND", (0,-1), (-1,-1), colors.lightgrey),
+            ("FONT", (0,-1), (-1,-1), FONT_BOLD),
+        ])
+
+        self.range_table_style = TableStyle([
+            ("BACKGROUND", (0,0), (-1,0), BRAND),
+            ("TEXTCOLOR", (0,0), (-1,0), colors.white),
+            ("FONT", (0,0), (-1,0), FONT_BOLD),
+            ("FONTSIZE", (0,0), (-1,-1), 8),
+
+            ("ROWBACKGROUNDS", (0,1), (-1,-1),
+             [colors.whitesmoke, colors.transparent]),
+
+            ("FONT", (0,1), (0,-1), FONT_BOLD),
+            ("ALIGN", (1,0), (-1,-1), "CENTER"),
+            ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+            ("GRID", (0,0), (-1,-1), 0.5, colors.grey),
+            ("TOPPADDING", (0,0), (-1,-1), 2),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 2),
+        ])
+
+        self.range_totals_style = TableStyle([
+            ("BACKGROUND", (0,0), (-1,-1), colors.lightgrey),
+            ("FONT", (0,0), (-1,-1), FONT_BOLD),
+            ("FONTSIZE", (0,0), (-1,-1), 8),
+            ("ALIGN", (1,0), (-1,-1), "CENTER"),
+            ("GRID", (0,0), (-1,-1), 0.5, colors.grey),
+        ])
+
+        # Phones: no zebra rows or per-cell fonts, just a header and grid
+        self.mobile_table_style = TableStyle([
+            ("BACKGROUND", (0,0), (-1,0), BRAND),
+            ("TEXTCOLOR", (0,0), (-1,0), colors.white),
+            ("FONT", (0,0), (-1,0), FONT_BOLD, 8),
+            ("FONTSIZE", (0,1), (-1,-1), 8),
+            ("FONT", (0,-1), (-1,-1), FONT_BOLD, 8),
+            ("ALIGN", (1,0), (-1,-1), "CENTER"),
+            ("GRID", (0,0), (-1,-1), 0.25, colors.grey),
+            ("TOPPADDING", (0,0), (-1,-1), 2),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 2),
+        ])
+
+        self.narration_style = TableStyle([
+            ("BOX", (0,0), (-1,-1), 0.75, BRAND),
+            ("BACKGROUND", (0,0), (-1,-1), colors.HexColor("#F4F7FB")),
+            ("PAD", (0,0), (-1,-1), 14),
+        ])
+
+        self.charts_style = TableStyle([
+            ("ALIGN", (0,0), (-1,-1), "CENTER"),
+            ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+
+            ("BOX", (0,1), (0,1), 0.5, colors.lightgrey),
+            ("BOX", (1,1), (1,1), 0.5, colors.lightgrey),
+
+            ("BACKGROUND", (0,1), (0,1), colors.whitesmoke),
+            ("BACKGROUND", (1,1), (1,1), colors.whitesmoke),
+
+            ("LEFTPADDING", (0,0), (-1,-1), 12),
+            ("RIGHTPADDING", (0,0), (-1,-1), 12),
+            ("TOPPADDING", (0,0), (-1,-1), 12),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 12),
+        ])
+
+        # -------------------------
+        # Palette
+        # -------------------------
+        self.session_colors = [
+            colors.HexColor("#1f77b4"),
+            colors.HexColor("#ff7f0e"),
+            colors.HexColor("#2ca02c"),
+        ]
+        self.up_color = colors.HexColor("#2e7d32")
+        self.down_color = colors.HexColor("#c62828")
+        self.arrows = {
+            1: ("↑", colors.green),
+            -1: ("↓", colors.red),
+            0: ("→", colors.grey),
+        }
+
+        # -------------------------
+        # Logo (decoded once)
+        # -------------------------
+        self.logo = None
+        if LOGO_PATH.exists():
+            self.logo = ImageReader(str(LOGO_PATH))
+            self.logo.getRGBData()
+            width, height = self.logo.getSize()
+            self.logo_size = (LOGO_HEIGHT * width / height, LOGO_HEIGHT)
+
+    def arrow(self, diff):
+        return self.arrows[(diff > 0) - (diff < 0)]
+
+    def delta_cell(self, value, diff, arrow=True):
+        return DeltaCell(self, value, diff, arrow)
+
+    def sparkline(self, values):
+        return Sparkline(values, self.up_color)
+
+    def draw_first_page(self, canvas, doc):
+        """
+        First-page decorations: logo in the top-left corner and the footer.
+        Later pages only get the footer.
+        """
+        if self.logo is not None:
+            width, height = self.logo_size
+            canvas.drawImage(
+                self.logo,
+                doc.leftMargin,
+                doc.pagesize[1] - doc.topMargin - height,
+                width=width,
+                height=height,
+                mask="auto",
+            )
+
+        self.draw_footer(canvas, doc)
+
+    def draw_footer(self, canvas, doc):
+        canvas.setFont(FONT, 9)
+        canvas.drawString(
+            2*cm, 1.2*cm,
+            "Generated by Farmgate • Confidential"
+        )
+
+
+class DeltaCell(Flowable):
+    """
+    Centred "value (diff) arrow" table cell drawn straight on the canvas.
+
+    Looks like the equivalent ``Paragraph`` markup but skips the markup
+    parsing and line layout, which dominate render time on large herds.
+    """
+    VALUE_SIZE = 9
+    DIFF_SIZE = 7
+
+    def __init__(self, template, value, diff, arrow=True):
+        super().__init__()
+        self.template = template
+        self.runs = [
+            (f"{value:.2f} ", self.VALUE_SIZE, colors.black),
+            (f"({diff:+.2f})", self.DIFF_SIZE, colors.black),
+        ]
+        if arrow:
+            char, color = template.arrow(diff)
+            self.runs.append((f" {char}", self.VALUE_SIZE, color))
+
+    def wrap(self, availWidth, availHeight):
+        self.width = availWidth
+        self.height = self.template.styles["Cell"].leading
+        return self.width, self.height
+
+    def draw(self):
+        canvas = self.canv
+        width = sum(
+            pdfmetrics.stringWidth(text, FONT, size) for text, size, _ in self.runs
+        )
+        x = (self.width - width) / 2
+        y = (self.height - self.VALUE_SIZE) / 2 + 1
+
+        # One text object per cell; font and colour switch between runs
+        text_object = canvas.beginText(x, y)
+        for text, size, color in self.runs:
+            text_object.setFont(FONT, size)
+            text_object.setFillColor(color)
+            text_object.textOut(text)
+        canvas.drawText(text_object)
+
+
+class Sparkline(Flowable):
+    """
+    Tiny trend line for a table cell, scaled to the series' own peak.
+    """
+    HEIGHT = 10
+
+    def __init__(self, values, color):
+        super().__init__()
+        self.values = values
+        self.color = color
+
+    def wrap(self, availWidth, availHeight):
+        self.width = availWidth
+        self.height = self.HEIGHT
+        return self.width, self.height
+
+    def draw(self):
+        peak = max(self.values, default=0)
+        if len(self.values) < 2 or not peak:
+            return
+
+        step = self.width / (len(self.values) - 1)
+        path = self.canv.beginPath()
+        for i, value in enumerate(self.values):
+            point = (i * step, value / peak * self.height)
+            if i:
+                path.lineTo(*point)
+            else:
+                path.moveTo(*point)
+
+        self.canv.setStrokeColor(self.color)
+        self.canv.setLineWidth(0.75)
+        self.canv.drawPath(path, stroke=1, fill=0)
+
+
+@lru_cache(maxsize=None)
+def get_report_template():
+    return ReportTemplate()
@@ -0,0 +1,197 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from production.models import CowDailyMilk, FarmDailyMilk, MilkRecord
+from accounts.models import Cow, Farm
+
+
+SESSION_COLUMNS = {
+    MilkRecord.MORNING: "morning",
+    MilkRecord.AFTERNOON: "afternoon",
+    MilkRecord.EVENING: "evening",
+}
+
+
+def refresh_milk_rollups(keys):
+    """
+    Recompute the rollups touched by a write.
+
+    ``keys`` are (cow_id, date) pairs whose MilkRecords changed. Call it
+    in the same transaction as the write. The affected farm rows are
+    locked first, so concurrent writers to one farm recompute one after
+    another and the last commit always sees every committed record.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+
+    cow_ids = {cow_id for cow_id, _ in keys}
+    dates = {day for _, day in keys}
+
+    with transaction.atomic():
+        cow_farms = dict(
+            Cow.objects.filter(id__in=cow_ids).values_list("id", "farm_id")
+        )
+        farm_ids = set(cow_farms.values())
+        list(
+            Farm.objects
+            .select_for_update()
+            .filter(id__in=farm_ids)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+        _refresh_cow_daily(keys, cow_ids, dates, cow_farms)
+        _refresh_farm_daily(
+            {(cow_farms[cow_id], day) for cow_id, day in keys if cow_id in cow_farms},
+            farm_ids,
+            dates,
+        )
+
+
+def _refresh_cow_daily(keys, cow_ids, dates, cow_farms):
+    totals = (
+        MilkRecord.objects
+        .filter(cow_id__in=cow_ids, date__in=dates)
+        .values("cow_id", "date")
+        .annotate(
+            total=Sum("quantity_in_liters"),
+            **{
+                column: Sum("quantity_in_liters", filter=Q(session=session))
+                for session, column in SESSION_COLUMNS.items()
+            },
+        )
+        .order_by()
+    )
+
+    rows = []
+    for row in totals:
+        if (row["cow_id"], row["date"]) not in keys:
+            continue
+        rows.append(CowDailyMilk(
+            cow_id=row["cow_id"],
+            farm_id=cow_farms[row["cow_id"]],
+            date=row["date"],
+            total=row["total"] or Decimal("0"),
+            **{
+                column: row[column] or Decimal("0")
+                for column in SESSION_COLUMNS.values()
+            },
+        ))
+
+    CowDailyMilk.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["cow", "date"],
+        update_fields=[
+            "farm", "morning", "afternoon", "evening", "total", "updated_at",
+        ],
+    )
+
+    # Keys left without records (deletes) lose their rollup row
+    present = {(row.cow_id, row.date) for row in rows}
+    _delete_missing(
+        CowDailyMilk, keys - present, lambda cow_id, day: Q(cow_id=cow_id, date=day)
+    )
+
+
+def _refresh_farm_daily(farm_days, farm_ids, dates):
+    totals = (
+        MilkRecord.objects
+        .filter(cow__farm_id__in=farm_ids, date__in=dates)
+        .values("cow__farm_id", "date", "session")
+        .annotate(total=Sum("quantity_in_liters"), record_count=Count("id"))
+        .order_by()
+    )
+
+    rows = [
+        FarmDailyMilk(
+            farm_id=row["cow__farm_id"],
+            date=row["date"],
+            session=row["session"],
+            total=row["total"] or Decimal("0"),
+            record_count=row["record_count"],
+        )
+        for row in totals
+        if (row["cow__farm_id"], row["date"]) in farm_days
+    ]
+
+    FarmDailyMilk.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["farm", "date", "session"],
+        update_fields=["total", "record_count", "updated_at"],
+    )
+
+    present = defaultdict(set)
+    for row in rows:
+        present[(row.farm_id, row.date)].add(row.session)
+
+    stale = Q()
+    for farm_id, day in farm_days:
+        stale |= Q(farm_id=farm_id, date=day) & ~Q(
+            session__in=present[(farm_id, day)]
+        )
+    if stale:
+        FarmDailyMilk.objects.filter(stale).delete()
+
+
+def _delete_missing(model, keys, make_q):
+    stale = Q()
+    for key in keys:
+        stale |= make_q(*key)
+    if stale:
+        model.objects.filter(stale).delete()
+
+
+def backfill_milk_rollups(start=None, end=None, farm_ids=None):
+    """
+    Rebuild rollups from raw MilkRecords, one day per transaction.
+
+    Returns the number of (cow, date) keys refreshed.
+    """
+    records = MilkRecord.objects.all()
+    rollup_filter = Q()
+    if start:
+        records = records.filter(date__gte=start)
+        rollup_filter &= Q(date__gte=start)
+    if end:
+        records = records.filter(date__lte=end)
+        rollup_filter &= Q(date__lte=end)
+    if farm_ids:
+        records = records.filter(cow__farm_id__in=farm_ids)
+        rollup_filter &= Q(farm_id__in=farm_ids)
+
+    days = list(
+        records
+        .order_by("date")
+        .values_list("date", flat=True)
+        .distinct()
+    )
+
+    # Rollups for days that no longer have any records
+    for model in (CowDailyMilk, FarmDailyMilk):
+        model.objects.filter(rollup_filter).exclude(date__in=days).delete()
+
+    refreshed = 0
+    for day in days:
+        keys = {
+            (cow_id, day)
+            for cow_id in (
+                records
+                .filter(date=day)
+                .order_by()
+                .values_list("cow_id", flat=True)
+                .distinct()
+            )
+        }
+        with transaction.atomic():
+            for model in (CowDailyMilk, FarmDailyMilk):
+                model.objects.filter(rollup_filter, date=day).delete()
+            refresh_milk_rollups(keys)
+        refreshed += len(keys)
+
+    return refreshed
@@ -0,0 +1,88 @@
+import fcntl
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+
+
+class SingleFlightTimeout(Exception):
+    pass
+
+
+def _lock_id(key):
+    # pg advisory locks take a signed 64-bit key
+    digest = hashlib.sha1(key.encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+@contextmanager
+def single_flight(key, timeout=None, poll_interval=0.2):
+    """
+    Cross-process mutex for ``key``.
+
+    Uses a PostgreSQL session advisory lock when available, and falls back
+    to an flock'ed file under MEDIA_ROOT for other databases. Callers that
+    lose the race block until the holder finishes, so they can pick up
+    its result instead of repeating the work.
+    """
+    if timeout is None:
+        timeout = settings.REPORT_LOCK_TIMEOUT
+
+    if connection.vendor == "postgresql":
+        lock = _advisory_lock
+    else:
+        lock = _file_lock
+
+    with lock(key, timeout, poll_interval):
+        yield
+
+
+@contextmanager
+def _advisory_lock(key, timeout, poll_interval):
+    lock_id = _lock_id(key)
+    deadline = time.monotonic() + timeout
+
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [lock_id])
+            if cursor.fetchone()[0]:
+                break
+            if time.monotonic() >= deadline:
+                raise SingleFlightTimeout(key)
+            time.sleep(poll_interval)
+
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [lock_id])
+
+
+@contextmanager
+def _file_lock(key, timeout, poll_interval):
+    lock_dir = Path(settings.MEDIA_ROOT).resolve() / "locks"
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    lock_path = lock_dir / f"{hashlib.sha1(key.encode()).hexdigest()}.lock"
+    deadline = time.monotonic() + timeout
+
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise SingleFlightTimeout(key)
+                time.sleep(poll_interval)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
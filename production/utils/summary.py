@@ -0,0 +1,62 @@
+from production.models import MilkRecord
+
+
+SESSION_LABELS = (
+    (MilkRecord.MORNING, "🌅 Morning"),
+    (MilkRecord.AFTERNOON, "☀️ Afternoon"),
+    (MilkRecord.EVENING, "🌙 Evening"),
+)
+
+
+def _change(today, yesterday):
+    if not yesterday:
+        return ""
+    percent = (today - yesterday) / yesterday * 100
+    arrow = "▲" if percent > 0 else "▼" if percent < 0 else "▶"
+    return f" ({arrow} {abs(percent):.1f}% vs yesterday)"
+
+
+def format_daily_summary(data, top=3):
+    """
+    Compact WhatsApp text version of the daily report: farm total,
+    per-session totals and the top/bottom cows, from a ``DailyReportData``.
+
+    A few hundred bytes instead of a PDF, and no rendering.
+    """
+    today, yesterday = data.today, data.yesterday
+    total = data.total(today)
+
+    lines = [
+        f"📊 *{data.farm_name}* – {today:%a %d %b}",
+        f"Total: *{total:.2f} L*{_change(total, data.total(yesterday))}",
+    ]
+    for session, label in SESSION_LABELS:
+        lines.append(f"{label}: {data.session_total(session, today):.2f} L")
+
+    milked = []
+    missing = 0
+    for cow in data.cows:
+        cow_total = data.cow_total(cow.id, today)
+        if cow_total:
+            milked.append((cow_total, cow_total - data.cow_total(cow.id, yesterday), cow))
+        else:
+            missing += 1
+
+    milked.sort(key=lambda row: row[0], reverse=True)
+    best = milked[:top]
+    worst = milked[top:][-top:][::-1]
+
+    def cow_lines(rows):
+        return [
+            f"{i}. {cow.label} {qty:.2f} L ({diff:+.2f})"
+            for i, (qty, diff, cow) in enumerate(rows, start=1)
+        ]
+
+    if best:
+        lines += ["", "🏆 *Top cows*", *cow_lines(best)]
+    if worst:
+        lines += ["", "⚠️ *Lowest cows*", *cow_lines(worst)]
+    if missing:
+        lines += ["", f"❔ {missing} cow(s) with no milk recorded today"]
+
+    return "\n".join(lines)
@@ -0,0 +1,265 @@
+import hashlib
+import os
+import random
+import threading
+import time
+
+import requests
+from decouple import config
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from production.utils.ratelimit import TokenBucket
+
+
+GRAPH_URL = "https://graph.facebook.com"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    Raised without touching the network while the Graph API is failing.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and lets a
+    single trial request through once ``reset_timeout`` seconds pass.
+    """
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: let this caller probe, keep the rest out
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class WhatsAppClient:
+    """
+    Graph API client shared by the webhook view and management commands.
+
+    Keeps a pooled keep-alive session, applies connect/read timeouts,
+    retries 429/5xx and connection failures with jittered exponential
+    backoff, and stops calling the API while the circuit is open.
+
+    One client per sender number: each has its own rate limit (every
+    request, retries included, takes a token) and circuit breaker. Both
+    live in this process only; see ``process_rate``.
+    """
+    def __init__(self, phone_number_id, access_token):
+        self.phone_number_id = phone_number_id
+        self.bucket = TokenBucket(process_rate())
+        self.timeout = (
+            settings.WHATSAPP_CONNECT_TIMEOUT,
+            settings.WHATSAPP_READ_TIMEOUT,
+        )
+        self.max_retries = settings.WHATSAPP_MAX_RETRIES
+        self.breaker = CircuitBreaker(
+            settings.WHATSAPP_CIRCUIT_FAILURES,
+            settings.WHATSAPP_CIRCUIT_RESET_SECONDS,
+        )
+
+        base_url = f"{GRAPH_URL}/{settings.WHATSAPP_API_VERSION}/{phone_number_id}"
+        self.messages_url = f"{base_url}/messages"
+        self.media_url = f"{base_url}/media"
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.WHATSAPP_POOL_SIZE,
+        )
+        self.session.mount("https://", adapter)
+        self.session.headers["Authorization"] = f"Bearer {access_token}"
+
+    # =========================
+    # Transport
+    # =========================
+    def _backoff(self, attempt, response=None):
+        retry_after = response is not None and response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), settings.WHATSAPP_BACKOFF_MAX)
+
+        # Full jitter keeps retrying workers from stampeding together
+        ceiling = min(
+            settings.WHATSAPP_BACKOFF_MAX,
+            settings.WHATSAPP_BACKOFF_BASE * (2 ** attempt),
+        )
+        return random.uniform(0, ceiling)
+
+    def _post(self, url, make_kwargs):
+        """
+        POST with retries. ``make_kwargs`` builds fresh request kwargs per
+        attempt so file handles can be reopened.
+        """
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError("WhatsApp circuit breaker is open")
+
+            self.bucket.acquire()
+            response = None
+            try:
+                response = self.session.post(
+                    url, timeout=self.timeout, **make_kwargs()
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                # Read timeouts are retried too: a duplicate message beats
+                # a lost one, and the outbox is at-least-once anyway
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    response.raise_for_status()
+                    return response
+
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    response.raise_for_status()
+
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    # =========================
+    # API
+    # =========================
+    def send_text(self, phone, text):
+        return self._post(self.messages_url, lambda: {"json": {
+            "messaging_product": "whatsapp",
+            "to": phone,
+            "text": {"body": text},
+        }})
+
+    def send_document(self, phone, media_id, caption):
+        return self._post(self.messages_url, lambda: {"json": {
+            "messaging_product": "whatsapp",
+            "to": phone,
+            "type": "document",
+            "document": {
+                "id": media_id,
+                "caption": caption,
+            },
+        }})
+
+    def upload_pdf(self, pdf, filename=None):
+        """
+        Upload a PDF and return its media id. ``pdf`` may be a file path,
+        raw bytes or a seekable binary file such as an in-memory render.
+        """
+        if isinstance(pdf, (str, os.PathLike)):
+            filename = filename or os.path.basename(pdf)
+        filename = filename or "report.pdf"
+        handles = []
+
+        def open_pdf():
+            if isinstance(pdf, (bytes, bytearray)):
+                return pdf
+            if hasattr(pdf, "read"):
+                pdf.seek(0)
+                return pdf
+            handle = open(pdf, "rb")
+            handles.append(handle)
+            return handle
+
+        def make_kwargs():
+            return {
+                "files": {
+                    "file": (filename, open_pdf(), "application/pdf")
+                },
+                "data": {"messaging_product": "whatsapp"},
+            }
+
+        try:
+            response = self._post(self.media_url, make_kwargs)
+        finally:
+            for handle in handles:
+                handle.close()
+
+        return response.json()["id"]  # media_id
+
+
+def process_rate():
+    """
+    Calls per second this process may make from one sender number.
+
+    Token buckets are per process, and web workers, the outbox worker and
+    the daily report run all send at once, so the tier's
+    ``WHATSAPP_MESSAGES_PER_SECOND`` is split evenly over the
+    ``WHATSAPP_SENDING_PROCESSES`` expected to be sending.
+    """
+    return (
+        settings.WHATSAPP_MESSAGES_PER_SECOND
+        / max(1, settings.WHATSAPP_SENDING_PROCESSES)
+    )
+
+
+_clients = {}
+_client_lock = threading.Lock()
+
+
+def sender_ids():
+    """
+    Phone number ids we send from: ``WHATSAPP_SENDER_IDS``, or the single
+    ``PHONE_NUMBER_ID`` when no pool is configured.
+    """
+    return settings.WHATSAPP_SENDER_IDS or [config("PHONE_NUMBER_ID")]
+
+
+def get_client(phone_number_id=None):
+    """
+    Process-wide WhatsApp client for a sender number (the first configured
+    one by default), so every caller shares its connection pool, rate
+    limit and circuit breaker.
+    """
+    phone_number_id = phone_number_id or sender_ids()[0]
+    client = _clients.get(phone_number_id)
+    if client is None:
+        with _client_lock:
+            client = _clients.get(phone_number_id)
+            if client is None:
+                client = _clients[phone_number_id] = WhatsAppClient(
+                    phone_number_id,
+                    config("WHATS_APP_API_KEY"),
+                )
+    return client
+
+
+def _affinity(phone_number_id, recipient):
+    digest = hashlib.sha1(f"{phone_number_id}:{recipient}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def get_sender(recipient):
+    """
+    Client of the pool number that owns ``recipient``.
+
+    Rendezvous hashing keeps every recipient on one sender, so they always
+    hear from the same number, and adding or removing a number only moves
+    that number's share of recipients.
+    """
+    return get_client(
+        max(sender_ids(), key=lambda sender: _affinity(sender, recipient))
+    )
@@ -4,30 +4,53 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from accounts.permissions import IsSystemUser
 from rest_framework import status
+from rest_framework.exceptions import ParseError
 from accounts.models import Account, User, Farm, Cow
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse
-import requests
 from decouple import config
 from datetime import date
 from decimal import Decimal, InvalidOperation
-from django.http import FileResponse
-from production.utils.utils import generate_milk_report
+from django.http import FileResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from production.utils.report_cache import (
+    get_data_version,
+    get_or_generate_report,
+    open_report,
+    prewarm_report,
+)
+from production.utils.file_serving import serve_report_file, stream_file
 from production.utils.pdf import MilkProductionPDFReport
+from production.utils.render_service import RenderTimeout, get_render_service
+from production.utils.report_data import (
+    PERIODS,
+    load_daily_report_data,
+    load_range_report_data,
+    report_period,
+)
+from production.utils.summary import format_daily_summary
+from production.utils.singleflight import SingleFlightTimeout
+from production.utils.inbound import record_inbound, dispatch_inbound
+from production.utils.outbound import enqueue_report, enqueue_text
 from production.models import ChatSession, MilkRecord
 from accounts.models import User, Cow, Farm
 from datetime import timedelta
 from django.utils import timezone
-from django.db.models import Sum
+from django.db import transaction
+from django.conf import settings
 from django.utils.dateparse import parse_date
 
 
 # from rest_framework.views import APIView
+import csv
 import json
+from io import BytesIO
 
-from production.serializers import MilkRecordSerializer
+from production.serializers import MilkRecordSerializer, MilkRecordBulkSerializer
+from production.utils.records import upsert_milk_records
+from production.utils.pagination import KeysetPaginator, InvalidCursor
 
 # Create your views here.
 
@@ -85,12 +108,29 @@ from production.serializers import MilkRecordSerializer
 #             status=status.HTTP_400_BAD_REQUEST
 #         )
 
-class MilkRecordAPIView(APIView):
-    permission_classes = [IsAuthenticated]
-
-    def get(self, request):
+def parse_query_date(value):
+    """
+    Parse a ``YYYY-MM-DD`` query param. Returns None when it is missing,
+    malformed or not a real day (``2024-02-30``).
+    """
+    try:
+        return parse_date(value or "")
+    except ValueError:
+        return None
+
+
+class MilkRecordFilterMixin:
+    """
+    Tenant scoping and query-param filters shared by milk record listings.
+    """
+    def get_milk_records(self, request):
+        """
+        Return the filtered records visible to the user, or None if a
+        tenant user has no account. Invalid filter values raise a 400
+        rather than being ignored.
+        """
         user = request.user
-        date_str = request.query_params.get("date")
+        params = request.query_params
 
         records = MilkRecord.objects.select_related(
             "cow",
@@ -101,56 +141,289 @@ class MilkRecordAPIView(APIView):
         # 🔓 System users see everything
         if not user.is_system_user():
             if not user.account:
-                return Response(
-                    {"detail": "User has no account assigned"},
-                    status=status.HTTP_403_FORBIDDEN
-                )
+                return None
 
             records = records.filter(
                 cow__farm__account=user.account
             )
 
-        # 📅 Filter by date if provided
-        if date_str:
-            date = parse_date(date_str)
-            if date:
-                records = records.filter(date=date)
+        # 📅 Filter by date / date range if provided
+        for param, lookup in [
+            ("date", "date"),
+            ("date_from", "date__gte"),
+            ("date_to", "date__lte"),
+        ]:
+            if not params.get(param):
+                continue
+            value = parse_query_date(params[param])
+            if not value:
+                raise ParseError(f"Invalid {param}")
+            records = records.filter(**{lookup: value})
+
+        # 🐄 Filter by farm / cow / session
+        for param, lookup in [("farm", "cow__farm_id"), ("cow", "cow_id")]:
+            value = params.get(param)
+            if not value:
+                continue
+            if not value.isdigit():
+                raise ParseError(f"Invalid {param}")
+            records = records.filter(**{lookup: int(value)})
+
+        session = params.get("session")
+        if session:
+            if session not in dict(MilkRecord.SESSION_CHOICES):
+                raise ParseError("Invalid session")
+            records = records.filter(session=session)
+
+        return records
+
+
+class MilkRecordAPIView(MilkRecordFilterMixin, APIView):
+    permission_classes = [IsAuthenticated]
+    paginator = KeysetPaginator()
+
+    def get(self, request):
+        records = self.get_milk_records(request)
+        if records is None:
+            return Response(
+                {"detail": "User has no account assigned"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        cursor = request.query_params.get("cursor")
+        page_size = self.paginator.get_page_size(
+            request.query_params.get("page_size")
+        )
+
+        try:
+            page, next_cursor = self.paginator.paginate(
+                records, cursor=cursor, page_size=page_size
+            )
+        except InvalidCursor:
+            return Response(
+                {"detail": "Invalid cursor"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        next_url = None
+        if next_cursor:
+            query = request.query_params.copy()
+            query["cursor"] = next_cursor
+            next_url = request.build_absolute_uri(
+                f"{request.path}?{query.urlencode()}"
+            )
+
+        serializer = MilkRecordSerializer(page, many=True)
+        return Response(
+            {
+                "next": next_url,
+                "next_cursor": next_cursor,
+                "results": serializer.data,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class Echo:
+    """
+    File-like object whose write() hands the value back, so csv.writer
+    can produce one line at a time for streaming.
+    """
+    def write(self, value):
+        return value
+
+
+class MilkRecordExportAPIView(MilkRecordFilterMixin, APIView):
+    """
+    Stream milk records as CSV or NDJSON.
+
+    Rows are read through a server-side cursor and written as they are
+    fetched, so memory use does not depend on the export size.
+    """
+    permission_classes = [IsAuthenticated]
+
+    CHUNK_SIZE = 2000
+    COLUMNS = [
+        ("id", "id"),
+        ("farm", "cow__farm__name"),
+        ("cow_tag", "cow__tag_number"),
+        ("cow_name", "cow__name"),
+        ("date", "date"),
+        ("session", "session"),
+        ("quantity_in_liters", "quantity_in_liters"),
+        ("notes", "notes"),
+        ("created_at", "created_at"),
+    ]
+
+    def get(self, request):
+        records = self.get_milk_records(request)
+        if records is None:
+            return Response(
+                {"detail": "User has no account assigned"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        export_format = request.query_params.get("export_format", "csv")
+        if export_format not in {"csv", "ndjson"}:
+            return Response(
+                {"detail": "export_format must be csv or ndjson"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        serializer = MilkRecordSerializer(records, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        rows = (
+            records
+            .order_by("date", "created_at", "id")
+            .values_list(*[field for _, field in self.COLUMNS])
+            .iterator(chunk_size=self.CHUNK_SIZE)
+        )
+
+        if export_format == "csv":
+            stream = self.stream_csv(rows)
+            content_type = "text/csv"
+        else:
+            stream = self.stream_ndjson(rows)
+            content_type = "application/x-ndjson"
+
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        filename = f"milk-records-{date.today()}.{export_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    def stream_csv(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow([name for name, _ in self.COLUMNS])
+        for row in rows:
+            yield writer.writerow(row)
+
+    def stream_ndjson(self, rows):
+        names = [name for name, _ in self.COLUMNS]
+        for row in rows:
+            yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + "\n"
 
 
 class MilkProductionReportDownloadAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
+    MAX_RANGE_DAYS = 366
+
     def get(self, request):
         user = request.user
 
-        if not hasattr(user, "farm"):
+        farms = Farm.objects.select_related("account")
+        if not user.is_system_user():
+            if not user.account:
+                return Response(
+                    {"detail": "User is not associated with an account"},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            farms = farms.filter(account=user.account)
+
+        farm_id = request.query_params.get("farm")
+        if farm_id:
+            farm = farms.filter(id=farm_id).first() if farm_id.isdigit() else None
+        else:
+            farm = farms.order_by("id").first()
+
+        if not farm:
             return Response(
-                {"detail": "User is not associated with a farm"},
-                status=status.HTTP_403_FORBIDDEN
+                {"detail": "Farm not found"},
+                status=status.HTTP_404_NOT_FOUND
             )
 
-        pdf_path, total = generate_milk_report(user.farm)
+        report_date = date.today()
+        if request.query_params.get("date"):
+            report_date = parse_query_date(request.query_params["date"])
+            if not report_date:
+                return Response(
+                    {"detail": "Invalid date"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-        if not pdf_path or not os.path.exists(pdf_path):
+        params = request.query_params
+        if params.get("period") or params.get("start") or params.get("end"):
+            return self.range_report(request, farm, report_date)
+
+        profile = params.get("profile", "standard")
+        if profile not in MilkProductionPDFReport.PROFILES:
             return Response(
-                {"detail": "Report generation failed"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"detail": "profile must be one of: "
+                           f"{', '.join(MilkProductionPDFReport.PROFILES)}"},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        with open(pdf_path, "rb") as pdf:
-            response = HttpResponse(
-                pdf.read(),
-                content_type="application/pdf"
-            )
+        filename = f"milk-production-report-{farm.id}-{report_date}.pdf"
 
-        filename = f"milk-production-report-{user.farm.id}.pdf"
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
-        response["Content-Length"] = os.path.getsize(pdf_path)
+        try:
+            # Cached renders can be handed off to the front-end server
+            if settings.REPORT_CACHE_ENABLED:
+                return serve_report_file(
+                    request,
+                    get_or_generate_report(farm, report_date, profile=profile),
+                    filename,
+                )
 
-        return response
+            pdf = open_report(farm, report_date, profile=profile)
+        except (RenderTimeout, SingleFlightTimeout):
+            return self.still_rendering()
+
+        return stream_file(request, pdf, pdf.getbuffer().nbytes, filename)
+
+    def range_report(self, request, farm, anchor):
+        """
+        Weekly / monthly report (``?period=week|month``, around ``?date=``)
+        or a custom ``?start=&end=`` range, optionally for one ``?cow=``.
+        """
+        params = request.query_params
+        period = params.get("period")
+
+        if period:
+            if period not in PERIODS:
+                return Response(
+                    {"detail": f"period must be one of: {', '.join(PERIODS)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            start, end = report_period(period, anchor)
+        else:
+            start = parse_query_date(params.get("start"))
+            end = parse_query_date(params.get("end"))
+            if not start or not end or start > end:
+                return Response(
+                    {"detail": "Valid start and end dates are required (start <= end)"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if (end - start).days >= self.MAX_RANGE_DAYS:
+                return Response(
+                    {"detail": f"Ranges are limited to {self.MAX_RANGE_DAYS} days"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        cow_ids = None
+        cow_id = params.get("cow")
+        if cow_id:
+            if not cow_id.isdigit() or not farm.cows.filter(id=cow_id).exists():
+                return Response(
+                    {"detail": "Cow not found"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            cow_ids = [int(cow_id)]
+
+        data = load_range_report_data(farm, start, end, cow_ids, period)
+        try:
+            pdf = get_render_service().render(data)
+        except RenderTimeout:
+            return self.still_rendering()
+
+        filename = f"milk-production-report-{farm.id}-{start}-{end}.pdf"
+        if cow_ids:
+            filename = f"milk-production-report-{farm.id}-cow-{cow_id}-{start}-{end}.pdf"
+        return stream_file(request, BytesIO(pdf), len(pdf), filename)
+
+    def still_rendering(self):
+        return Response(
+            {"detail": "Report is still rendering, try again shortly"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": "10"},
+        )
 
 
 class ProductionCallBack(APIView):
@@ -158,8 +431,6 @@ class ProductionCallBack(APIView):
     permission_classes = []
 
     VERIFY_TOKEN = config("VERIFY_TOKEN")
-    PHONE_NUMBER_ID = config("PHONE_NUMBER_ID")
-    ACCESS_TOKEN = config("WHATS_APP_API_KEY")
     INACTIVITY_TIMEOUT = timedelta(minutes=10)
 
     # =========================
@@ -177,6 +448,8 @@ class ProductionCallBack(APIView):
     # Incoming messages
     # =========================
     def post(self, request):
+        # Persist and acknowledge right away; routing runs on the worker
+        # pool so Meta never waits on DB lookups, Graph API calls or PDFs.
         try:
             value = request.data["entry"][0]["changes"][0]["value"]
             message = value.get("messages", [{}])[0]
@@ -184,10 +457,11 @@ class ProductionCallBack(APIView):
             if message.get("type") != "text":
                 return HttpResponse("OK")
 
-            phone = message["from"]
-            text = message["text"]["body"].strip()
-
-            self.route_message(phone, text)
+            inbound = record_inbound(message)
+            if inbound:
+                transaction.on_commit(
+                    lambda: dispatch_inbound(inbound.phone)
+                )
 
         except Exception as e:
             print("Webhook error:", e)
@@ -195,6 +469,12 @@ class ProductionCallBack(APIView):
         return HttpResponse("OK")
 
     def route_message(self, phone, text):
+        # Session changes and the replies they trigger commit together;
+        # replies go out from the outbox once the transaction commits
+        with transaction.atomic():
+            self._route_message(phone, text)
+
+    def _route_message(self, phone, text):
         session, _ = ChatSession.objects.get_or_create(phone=phone)
 
         # ⏱️ RESET IF INACTIVE
@@ -238,7 +518,8 @@ class ProductionCallBack(APIView):
         menu = ["1️⃣ Enter milk production"]
 
         if user.role in {User.MANAGER, User.ACCOUNT_OWNER}:
-            menu.append("2️⃣ Get today’s report")
+            menu.append("2️⃣ Today’s summary")
+            menu.append("3️⃣ Today’s full report (PDF)")
 
         self.send(
             user.phone,
@@ -256,6 +537,9 @@ class ProductionCallBack(APIView):
             )
 
         if text == "2" and user.role in {User.MANAGER, User.ACCOUNT_OWNER}:
+            return self.handle_summary(session, user, text)
+
+        if text == "3" and user.role in {User.MANAGER, User.ACCOUNT_OWNER}:
             self.send(
                 user.phone, "📊 Generating today’s report, this may take a moment.")
             return self.handle_report(session, user, text)
@@ -271,10 +555,13 @@ class ProductionCallBack(APIView):
         if text not in session_map:
             return self.send(user.phone, "Reply 1, 2 or 3.")
 
+        # Pin the cow order shown to the user for the rest of the flow
+        cows = list(Cow.objects.filter(farm=session.farm).order_by("id"))
+
         session.data["session"] = session_map[text]
+        session.data["cow_ids"] = [c.id for c in cows]
         session.step = "enter_milk"
         session.save()
-        cows = Cow.objects.filter(farm=session.farm)
         cow_list = "\n".join(
             f"{i+1}. {c.tag_number}" for i, c in enumerate(cows))
         self.send(
@@ -283,7 +570,9 @@ class ProductionCallBack(APIView):
         )
 
     def handle_enter_milk(self, session, user, text):
-        cows = list(Cow.objects.filter(farm=session.farm))
+        cow_ids = session.data.get("cow_ids", [])
+        cows_by_id = Cow.objects.in_bulk(cow_ids)
+        cows = [cows_by_id[cow_id] for cow_id in cow_ids if cow_id in cows_by_id]
 
         try:
             values = [Decimal(v.strip()) for v in text.split(",")]
@@ -296,6 +585,7 @@ class ProductionCallBack(APIView):
                 f"❌ Expected {len(cows)} values."
             )
 
+        session.data["cow_ids"] = [cow.id for cow in cows]
         session.data["milk_values"] = [str(v) for v in values]
         session.step = "confirm_milk"
         session.save()
@@ -319,46 +609,59 @@ class ProductionCallBack(APIView):
         if text != "1":
             return self.send(user.phone, "Reply 1 to confirm or 2 to re-enter.")
 
-        cows = Cow.objects.filter(farm=session.farm)
+        today = date.today()
+        milk_session = session.data["session"]
         values = [Decimal(v) for v in session.data["milk_values"]]
 
-        for cow, qty in zip(cows, values):
-            MilkRecord.objects.update_or_create(
-                cow=cow,
-                date=date.today(),
-                session=session.data["session"],
-                defaults={"quantity_in_liters": qty, "recorded_by": user},
+        # The whole session in one upsert, against the cows the user saw
+        with transaction.atomic():
+            upsert_milk_records(
+                [
+                    {
+                        "cow_id": cow_id,
+                        "date": today,
+                        "session": milk_session,
+                        "quantity_in_liters": qty,
+                    }
+                    for cow_id, qty in zip(session.data["cow_ids"], values)
+                ],
+                recorded_by=user,
+                update_fields=["quantity_in_liters", "recorded_by", "updated_at"],
             )
+            self.reset(session)
 
-        self.reset(session)
         self.send(user.phone, "✅ Milk production saved.")
 
-    def handle_report(self, session, user, text):
-        # 1️⃣ Generate PDF
-        report = MilkProductionPDFReport(session.farm)
-        pdf_path = report.generate()
-
-        # 2️⃣ Upload to WhatsApp
-        media_id = self.upload_pdf(pdf_path)
-
-        # 3️⃣ Send short summary text first (good UX)
-        today = date.today()
-        total = (
-            MilkRecord.objects
-            .filter(cow__farm=session.farm, date=today)
-            .aggregate(total=Sum("quantity_in_liters"))["total"]
-            or 0
-        )
-
+    def handle_summary(self, session, user, text):
+        # Straight from the rollups: two queries and a short text message
+        data = load_daily_report_data(session.farm, date.today())
         self.send(
             user.phone,
-            f"📊 *Today’s Milk Summary*\n\nTotal milk: {total} L\n\n📄 Detailed report attached below."
+            format_daily_summary(data) + "\n\n📄 Reply 3 for the full PDF report."
         )
 
-        # 4️⃣ Send PDF document
-        self.send_pdf(user.phone, media_id)
+        # Stay on the menu so "3" works, and warm the PDF cache in the
+        # background once the summary is committed; the inbound lane moves
+        # on to the next message straight away
+        if settings.REPORT_CACHE_ENABLED:
+            farm = session.farm
+            version = get_data_version(farm, data.today)
+            transaction.on_commit(
+                lambda: prewarm_report(
+                    farm,
+                    data.today,
+                    data=data,
+                    version=version,
+                    profile=settings.WHATSAPP_REPORT_PROFILE,
+                )
+            )
+
+    def handle_report(self, session, user, text):
+        # 1️⃣ Queue the PDF (the text summary is menu option 2); the outbox
+        #    renders through the report cache, uploads once and sends it
+        self.send_pdf(user.phone, session.farm)
 
-        # 5️⃣ Reset conversation
+        # 2️⃣ Reset conversation
         self.reset(session)
 
     def handle_incident(self, session, user, text):
@@ -374,64 +677,15 @@ class ProductionCallBack(APIView):
         session.save()
 
     def send(self, phone, text):
-        requests.post(
-            f"https://graph.facebook.com/v18.0/{self.PHONE_NUMBER_ID}/messages",
-            headers={
-                "Authorization": f"Bearer {self.ACCESS_TOKEN}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "messaging_product": "whatsapp",
-                "to": phone,
-                "text": {"body": text},
-            },
-        )
+        enqueue_text(phone, text)
 
     def get_user_by_phone(self, phone):
         return User.objects.filter(phone=phone).first()
 
-    def upload_pdf(self, file_path):
-        url = f"https://graph.facebook.com/v18.0/{self.PHONE_NUMBER_ID}/media"
-
-        headers = {
-            "Authorization": f"Bearer {self.ACCESS_TOKEN}",
-        }
-
-        files = {
-            "file": (
-                file_path.split("/")[-1],
-                open(file_path, "rb"),
-                "application/pdf"
-            )
-        }
-
-        data = {"messaging_product": "whatsapp"}
-
-        response = requests.post(url, headers=headers, files=files, data=data)
-        response.raise_for_status()
-
-        return response.json()["id"]  # media_id
-
-    def send_pdf(self, phone, media_id):
-        url = f"https://graph.facebook.com/v18.0/{self.PHONE_NUMBER_ID}/messages"
-
-        headers = {
-            "Authorization": f"Bearer {self.ACCESS_TOKEN}",
-            "Content-Type": "application/json",
-        }
-
-        payload = {
-            "messaging_product": "whatsapp",
-            "to": phone,
-            "type": "document",
-            "document": {
-                "id": media_id,
-                "caption": "📊 Today’s Milk Production Report",
-            },
-        }
-
-        response = requests.post(url, headers=headers, json=payload)
-        print("SEND PDF:", response.status_code, response.text)
+    def send_pdf(self, phone, farm):
+        enqueue_report(
+            phone, farm, date.today(), "📊 Today’s Milk Production Report"
+        )
 
 
 class MilkBulkRecordAPIView(APIView):
@@ -445,21 +699,68 @@ class MilkBulkRecordAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        created_records = []
+        user = request.user
+        if not user.is_system_user() and not user.account:
+            return Response(
+                {"detail": "User has no account assigned"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
         errors = []
+        valid_rows = []
 
+        # 1️⃣ Validate rows without touching the database
         for index, record_data in enumerate(request.data):
-            serializer = MilkRecordSerializer(data=record_data)
+            serializer = MilkRecordBulkSerializer(data=record_data)
 
             if serializer.is_valid():
-                serializer.save(recorded_by=request.user)
-                created_records.append(serializer.data)
+                valid_rows.append((index, serializer.validated_data))
             else:
                 errors.append({
                     "index": index,
                     "errors": serializer.errors
                 })
 
+        # 2️⃣ Resolve every referenced cow in one tenant-scoped query
+        cows = Cow.objects.filter(id__in={row["cow"] for _, row in valid_rows})
+        if not user.is_system_user():
+            cows = cows.filter(farm__account=user.account)
+        known_cow_ids = set(cows.values_list("id", flat=True))
+
+        rows = []
+        for index, row in valid_rows:
+            if row["cow"] not in known_cow_ids:
+                errors.append({
+                    "index": index,
+                    "errors": {
+                        "cow": [f'Invalid pk "{row["cow"]}" - object does not exist.']
+                    }
+                })
+                continue
+
+            rows.append((index, {
+                "cow_id": row["cow"],
+                "date": row["date"],
+                "session": row["session"],
+                "quantity_in_liters": row["quantity_in_liters"],
+                "notes": row.get("notes", ""),
+            }))
+
+        # 3️⃣ One INSERT ... ON CONFLICT (cow, date, session) in a transaction
+        stored = upsert_milk_records(
+            [row for _, row in rows],
+            recorded_by=user,
+            return_records=True,
+        )
+
+        created_records = [
+            MilkRecordSerializer(
+                stored[(row["cow_id"], row["date"], row["session"])]
+            ).data
+            for _, row in rows
+        ]
+        errors.sort(key=lambda error: error["index"])
+
         return Response(
             {
                 "created_records": created_records,